@@ -4,240 +4,227 @@ import sys
 import os
 from dotenv import load_dotenv
 from pathlib import Path
-import datetime
 import time  
+from functools import partial
+
+sys.path.append(str(Path('..', 'Simulator')))
+import codec
+import flow
+import metrics
+import profiling
+import scenario
+import validator
+from logs import get_logger
+from clock import make_clock
+from commands import StationCommands, answer_message
+from report import PendingCalls, RunReport
+from session import ChargePointSession
 
 env_path = Path('..', '.env')
 load_dotenv(dotenv_path=env_path)
 
 url = os.getenv('WEBSOCKET_URL')
 socketProtocol = os.getenv('SEC_WEB_SOCKET_PROTOCOL')
+clockSpeed = os.getenv('CLOCK_SPEED')
+metricsPort = os.getenv('METRICS_PORT')
+profileMode = os.getenv('PROFILE')
+profileOutput = os.getenv('PROFILE_OUTPUT', 'profile')
+
+log = get_logger('test')
 
 def load_request_messages(file_path):
     with open(file_path, 'r') as file:
         return json.load(file)
 
-def validate_status_notification_request(payload):
-    required_fields = ["connectorId", "errorCode", "status", "timestamp"]
-    allowed_error_codes = [
-        "ConnectorLockFailure", "EVCommunicationError", "GroundFailure",
-        "HighTemperature", "InternalError", "LocalListConflict", "NoError"
-    ]
-    allowed_statuses = [
-        "Available", "Preparing", "Charging", "SuspendedEVSE", "SuspendedEV",
-        "Finishing", "Reserved", "Unavailable", "Faulted"
-    ]
-
-    for field in required_fields:
-        if field not in payload:
-            print(f"Validation failed: Missing required field '{field}'")
-            return False
-        
-        if field == "errorCode" and payload[field] not in allowed_error_codes:
-            print(f"Validation failed: Invalid errorCode '{payload[field]}'")
-            return False
-        
-        if field == "status" and payload[field] not in allowed_statuses:
-            print(f"Validation failed: Invalid status '{payload[field]}'")
-            return False
-
-    print("StatusNotification request validation successful.")
-    return True    
-
 def validate_request_fields(request_message):
     message_type = request_message[2]
-    payload = request_message[3]
-    
-    if message_type == "BootNotification":
-        required_fields = ["chargePointVendor", "chargePointModel"]
-    elif message_type == "Authorize":
-        required_fields = ["idTag"]
-    elif message_type == "HeartBeat":
-        required_fields = [];      
-    elif message_type == "StartTransaction":
-        required_fields = ["connectorId", "idTag", "meterStart", "timestamp"]
-    elif message_type == "StatusNotification":
-        return validate_status_notification_request(payload);
-    elif message_type == "StopTransaction":
-        required_fields = ["idTag", "meterStop", "timestamp", "transactionId"]
-    elif message_type == "MeterValues":
-        required_fields = ["connectorId", "meterValue"]                
-    else:
-        required_fields = [] 
+    errors = validator.validate_request(message_type, request_message[3])
+    if errors:
+        for error in errors:
+            log.warning(f"Validation failed: {error}")
+        log.warning("")
+        return False
 
-    payload = request_message[3]
-    for field in required_fields:
-        if field not in payload:
-            print(f"Validation failed: Missing required field '{field}'\n")
-            return False
-    
-    print(f"{message_type} validation successful.")
+    log.info(f"{message_type} validation successful.")
     return True
 
-def validate_response_fields(ws, response_message):
+def validate_response_fields(run, response_message):
     try:
         #print(f"Raw response received: {response_message}")
-        response = json.loads(response_message)
-
-        if not isinstance(response, list):
-            print("Validation failed: Response is not a valid JSON array.\n")
-            return False
-        
-        if len(response) < 3:
-            print("Validation failed: Response array does not have enough elements.\n")
-            return False
-        
-        payload = response[2]
-
-        if ws.expected_type == "BootNotification":
-            if payload.get("status") != "Accepted":
-                print(f"Validation failed: Status is not 'Accepted', is '{payload.get('status')}'\n")
-                return False
-            if payload.get("interval") != 900:
-                print(f"Validation failed: Interval is not 900, but '{payload.get('interval')}'\n")
-                return False
-        elif ws.expected_type == "Authorize":
-            if payload.get("idTagInfo", {}).get("status") != "Accepted":
-                print(f"Validation failed: idTagInfo status is not 'Accepted', but '{payload.get('idTagInfo', {}).get('status')}'\n")
-                return False
-            ws.saved_idTag = ws.current_request[3].get("idTag")
-        elif ws.expected_type == "HeartBeat":
-            if "currentTime" not in payload:
-               print("Validation failed: Not received valid response. Missing 'currentTime' in HeartBeat response.\n")
-               return False
-        elif ws.expected_type == "StartTransaction":
-            if payload.get("idTagInfo", {}).get("status") != "Accepted":
-                print(f"Validation failed: idTagInfo status is not 'Accepted', is '{payload.get('idTagInfo', {}).get('status')}'\n")
-                return False
-            if ws.saved_idTag != ws.current_request[3].get("idTag"):
-                print(f"Validation failed: idTag in StartTransaction does not match the saved idTag from Authorize.\n")
-                return False
-            if "transactionId" not in payload:
-                print(f"Validation failed: Missing transactionId in StartTransaction response.\n")
-                return False
-            ws.saved_transactionId = payload["transactionId"]
-            #Validate connectorId ToDo
-            
-        elif ws.expected_type == "StatusNotification":
-            if payload != {}:
-                print(f"Validation failed: StatusNotification response should be empty, but got {payload}.\n")
-                return False
-        elif ws.expected_type == "StopTransaction":
-            if payload.get("errorCode") == 6 and payload.get("ErrorDescription") == "Invalid payload for StopTransaction message":
-                print(f"Validation failed: {payload}\n")
-                return False 
-        elif ws.expected_type == "MeterValues":
-            if payload.get("Status") != "Accepted":
-                print(f"Validation failed: Status is not 'Accepted', is '{payload.get('status')}'\n")
-                return False
-            if ws.saved_transactionId != ws.current_request[3].get("transactionId"):
-                print(f"Validation failed: transactionId in MeterValues does not match transactionId from StartTransaction.\n")
-                return False
-            time.sleep(60)   
-
-            # Validate connectorId ToDo     
-                
-        print(f"{ws.expected_type} response validation successful.\n")
-        return True
-    except json.JSONDecodeError as e:
-        print(f"Validation failed: JSON parsing error - {str(e)}\n")
+        response = codec.loads(response_message)
+    except codec.DecodeError as e:
+        log.warning(f"Validation failed: JSON parsing error - {str(e)}\n")
+        run.report.counters['validation_failed'] += 1
+        run.report.counters['error: response is not valid JSON'] += 1
+        return False
+
+    action = run.request[2]
+    started = time.perf_counter()
+    error = flow.validate_response_fields(run.session, run.request, response)
+    run.report.record_phase('validate', time.perf_counter() - started)
+    if error is not None:
+        log.warning(f"Validation failed: {error}\n")
+        run.report.counters['validation_failed'] += 1
+        run.report.counters['error: ' + error] += 1
         return False
 
-def on_message(ws, message):
-    print(f"Received response: {message}")
-    validate_response_fields(ws, message)
-    ws.current_request_index += 1
+    if action == "MeterValues":
+        run.session.clock.sleep_blocking(60)
 
-    if ws.current_request_index < len(ws.request_messages):
-        send_next_request(ws)
+    log.info(f"{action} response validation successful.\n")
+    return True
+
+def record_latency(run, message):
+    started = time.perf_counter()
+    try:
+        response = codec.loads(message)
+    except codec.DecodeError:
+        return None
+    run.report.record_phase('decode', time.perf_counter() - started)
+    if not isinstance(response, list) or len(response) < 2:
+        return None
+
+    if response[1] != run.request[1]:
+        log.warning(f"Warning: response uniqueId '{response[1]}' does not match the {run.request[2]} request '{run.request[1]}'")
+
+    answered = run.pending.answered(response[1])
+    if answered is not None:
+        run.report.record_latency(*answered)
+        run.report.record_phase('wait', answered[1])
+    return answered
+
+class ScriptRun:
+    # Everything one run of this script keeps between callbacks; the scenario
+    # state itself lives in the shared ChargePointSession.
+    __slots__ = ('session', 'pending', 'report', 'started', 'request', 'handlers')
+
+    def __init__(self, session):
+        self.session = session
+        # Answers CALLs from the central system; see Simulator/commands.py.
+        self.handlers = StationCommands(None, session).handlers()
+        self.pending = PendingCalls()
+        self.report = RunReport()
+        self.started = None
+        self.request = None
+
+def on_message(run, ws, message):
+    reply = answer_message(message, run.handlers)
+    if reply is not None:
+        # A CALL from the central system, not the response we are waiting for.
+        log.info(f"Received server CALL: {message}")
+        log.info(f"Answered: {reply}")
+        run.report.counters['server_calls'] += 1
+        ws.send(reply)
+        return
+
+    answered = record_latency(run, message)
+    if answered is not None:
+        log.info(f"Received response after {answered[1] * 1000:.1f} ms: {message}")
+    else:
+        log.info(f"Received response: {message}")
+    validate_response_fields(run, message)
+    run.session.index += 1
+
+    if run.session.index < len(run.session.steps):
+        send_next_request(run, ws)
     else:
-        print("All messages processed. Closing connection.")
+        log.info("All messages processed. Closing connection.")
         ws.close()
 
 def on_error(ws, error):
-    print(f"Error: {error}")
-
-def on_close(ws, close_status_code, close_msg):
-    print("Connection closed")
+    log.error(f"Error: {error}")
+
+def on_close(run, ws, close_status_code, close_msg):
+    log.info("Connection closed")
+    if run.started is not None:
+        run.report.elapsed_seconds = time.perf_counter() - run.started
+        print()
+        if run.report.transactions.started:
+            run.report.transactions.print_summary()
+            print()
+        run.report.print_latency()
+        print()
+        run.report.print_phases()
+
+def on_open(run, ws):
+    log.info("Opened connection")
+    run.started = time.perf_counter()
+    send_next_request(run, ws)
+
+def send_next_request(run, ws):
+    session = run.session
+    step = session.steps[session.index]
+
+    if step.action is None:
+        # A think time, or new values for the scenario's variables.
+        pause = step.run(session)
+        if pause:
+            session.clock.sleep_blocking(pause)
+        session.index += 1
+        if session.index < len(session.steps):
+            send_next_request(run, ws)
+        else:
+            ws.close()
+        return
+
+    started = time.perf_counter()
+    values, error = flow.request_values(session, step)
+    if error is not None:
+        log.error(f"Error: {error[0].upper() + error[1:]} request.")
+        return
+    # Unique within the run, unlike the uniqueIds in a recorded scenario.
+    values["uniqueId"] = f"{session.charge_point_id}-{session.index}"
+
+    if step.template is None:
+        log.info(f"Sending request: {step.message}")
+        validate_request_fields(step.message)
+        session.index += 1
+        if session.index < len(session.steps):
+            send_next_request(run, ws)
+        return
+
+    data = step.template.render(values).decode()
+    request = step.request(values)
+    run.report.record_phase('encode', time.perf_counter() - started)
+    log.info(f"Sending request: {data}")
+    # The frame actually sent, with the fields the flow and the variables filled in.
+    if not validate_request_fields(request):
+        session.index += 1
+        if session.index < len(session.steps):
+            send_next_request(run, ws)
+        return
+    run.request = request
+    run.pending.sent(run.request[1], step.action)
+    run.report.sent[step.action] += 1
+    started = time.perf_counter()
+    ws.send(data)
+    run.report.record_phase('send', time.perf_counter() - started)
 
-def on_open(ws):
-    print("Opened connection")
-    
+def run_websocket_client():
     if len(sys.argv) < 2:
-        print("Usage: python flow.py <request_file>")
+        print("Usage: python test.py <request_file>")
         sys.exit(1)
-    
-    request_file = sys.argv[1]
-    ws.request_messages = load_request_messages(request_file)
-    ws.current_request_index = 0
-    ws.saved_idTag = None
-    ws.saved_transactionId = None
-    ws.saved_timestamp = None
-    ws.current_time = None
-    send_next_request(ws)
-
-def send_next_request(ws):
-    current_request = ws.request_messages[ws.current_request_index]
-
-    if current_request[2] == "StartTransaction":
-        ws.current_time = datetime.datetime.now() 
-        startTransaction_time = ws.current_time - datetime.timedelta(hours=2)
-        current_request[3]["timestamp"] = startTransaction_time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + '7254'+ 'Z'
-        ws.saved_timestamp = current_request[3]["timestamp"]
-
-    if current_request[2] == "MeterValues":    
-        if ws.saved_transactionId is None:
-            print("Error: Missing transactionId for MeterValues request.")
-            return
-        
-        current_request[3]["transactionId"] = ws.saved_transactionId
-    
-        if ws.saved_timestamp is None:
-            print("Error: Missing timestamp for MeterValues request.")
-            return
-
-        timestamp_dt = datetime.datetime.fromisoformat(ws.saved_timestamp.replace("Z", "+00:00"))
-    
-        new_timestamp_dt = timestamp_dt + datetime.timedelta(minutes=1)
-    
-        new_timestamp = new_timestamp_dt.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + "Z"
-    
-        current_request[3]["meterValue"][0]["timestamp"] = new_timestamp
-
-        ws.saved_timestamp = new_timestamp
-
-        
-    if current_request[2] == "StopTransaction":
-        if ws.saved_transactionId is None:
-            print(f"Error: Missing transactionId for StopTransaction request.")
-            return
-        
-        current_request[3]["transactionId"] = ws.saved_transactionId
-        current_request[3]["timestamp"] =  ws.current_time.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + '7254'+ 'Z'     
 
-    print(f"Sending request: {current_request}")
-
-    if validate_request_fields(current_request):
-        ws.expected_type = current_request[2]
-        ws.current_request = current_request
-        ws.send(json.dumps(current_request))
-
-    else:
-        ws.current_request_index += 1
-        if ws.current_request_index < len(ws.request_messages):
-            send_next_request(ws)   
-
-def run_websocket_client():
+    try:
+        steps = scenario.compile_scenario(load_request_messages(sys.argv[1]))
+    except scenario.ScenarioError as e:
+        print(f"{sys.argv[1]}: {e}")
+        sys.exit(1)
+    run = ScriptRun(ChargePointSession(url.rsplit('/', 1)[-1], steps, make_clock(clockSpeed)))
+    run.session.transactions = run.report.transactions
+    if metricsPort:
+        metrics.serve_prometheus_in_thread(run.report, '127.0.0.1', int(metricsPort))
     ws = websocket.WebSocketApp(
         url,  
         header={"Sec-WebSocket-Protocol": socketProtocol}, 
-        on_open=on_open,
-        on_message=on_message,
+        on_open=partial(on_open, run),
+        on_message=partial(on_message, run),
         on_error=on_error,
-        on_close=on_close
+        on_close=partial(on_close, run)
     )
     
-    ws.run_forever()
+    with profiling.profiled(profileMode, profileOutput):
+        ws.run_forever()
 
 if __name__ == "__main__":
-    run_websocket_client()
\ No newline at end of file
+    run_websocket_client()
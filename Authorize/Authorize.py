@@ -1,10 +1,15 @@
 import websocket
 import json
 import sys
+import time
 import os
 from dotenv import load_dotenv
 from pathlib import Path
 
+sys.path.append(str(Path('..', 'Simulator')))
+import validator
+from commands import answer_message
+
 env_path = Path('..', '.env')
 load_dotenv(dotenv_path=env_path)
 
@@ -16,13 +21,12 @@ def load_request_message(file_path):
         return json.load(file)
 
 def validate_request_fields(request_message):
-    required_fields = ["idTag"]
-    payload = request_message[3] 
-    for field in required_fields:
-        if field not in payload:
-            print(f"Validation failed: Missing required field '{field}'")
-            return False
-    print("Validation successful: All required fields are present.")
+    errors = validator.validate_request(request_message[2], request_message[3])
+    if errors:
+        for error in errors:
+            print(f"Validation failed: {error}")
+        return False
+    print("Validation successful: Request matches the Authorize schema.")
     return True
 
 def validate_response_fields(response_message, ws):
@@ -39,8 +43,10 @@ def validate_response_fields(response_message, ws):
             return False
 
         payload = response[2]
-        if not isinstance(payload, dict) or "idTagInfo" not in payload:
-            print("Validation failed: Response payload is not valid or missing 'idTagInfo'.")
+        errors = validator.validate_response("Authorize", payload)
+        if errors:
+            for error in errors:
+                print(f"Validation failed: {error}")
             ws.close()
             return False
 
@@ -57,7 +63,12 @@ def validate_response_fields(response_message, ws):
         return False
 
 def on_message(ws, message):
-    print(f"Received response: {message}")
+    reply = answer_message(message)
+    if reply is not None:
+        print(f"Answered server CALL {message} with {reply}")
+        ws.send(reply)
+        return
+    print(f"Received response after {(time.perf_counter() - ws.sent_at) * 1000:.1f} ms: {message}")
     if validate_response_fields(message,ws):
         ws.close()
 
@@ -84,6 +95,7 @@ def on_open(ws):
         ws.close()
         return
     
+    ws.sent_at = time.perf_counter()
     ws.send(json.dumps(authorize_req))
     print("Sent Authorize request")
 
@@ -1,10 +1,15 @@
 import websocket
 import json
 import sys
+import time
 import os
 from dotenv import load_dotenv
 from pathlib import Path
 
+sys.path.append(str(Path('..', 'Simulator')))
+import validator
+from commands import answer_message
+
 env_path = Path('..', '.env')
 load_dotenv(dotenv_path=env_path)
 
@@ -16,16 +21,12 @@ def load_request_message(file_path):
         return json.load(file)
 
 def validate_request_fields(request_message):
-    required_fields = ["chargePointVendor", "chargePointModel"]
-    payload = request_message[3]
-    for field in required_fields:
-        if field not in payload:
-            print(f"Validation failed: Missing required field '{field}'")
-            return False
-        if not isinstance(payload[field], str):
-            print(f"Validation failed: Field '{field}' is not a string.")
-            return False
-    print("Validation successful: All required fields are present and are strings.")
+    errors = validator.validate_request(request_message[2], request_message[3])
+    if errors:
+        for error in errors:
+            print(f"Validation failed: {error}")
+        return False
+    print("Validation successful: Request matches the BootNotification schema.")
     return True
 
 def validate_response_fields(response_message, ws):
@@ -43,8 +44,10 @@ def validate_response_fields(response_message, ws):
         
         payload = response[2]
 
-        if not isinstance(payload, dict):
-            print("Validation failed: Payload is not a valid JSON object.")
+        errors = validator.validate_response("BootNotification", payload)
+        if errors:
+            for error in errors:
+                print(f"Validation failed: {error}")
             return False
         
         if payload.get("status") != "Accepted":
@@ -62,7 +65,12 @@ def validate_response_fields(response_message, ws):
         return False
 
 def on_message(ws, message):
-    print(f"Received response: {message}")
+    reply = answer_message(message)
+    if reply is not None:
+        print(f"Answered server CALL {message} with {reply}")
+        ws.send(reply)
+        return
+    print(f"Received response after {(time.perf_counter() - ws.sent_at) * 1000:.1f} ms: {message}")
     if validate_response_fields(message,ws):
         ws.close()
 
@@ -89,6 +97,7 @@ def on_open(ws):
         ws.close()
         return
     
+    ws.sent_at = time.perf_counter()
     ws.send(json.dumps(boot_notification_req))
     print("Sent BootNotification request")
 
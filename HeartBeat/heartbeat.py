@@ -1,10 +1,15 @@
 import websocket
 import json
 import sys
+import time
 import os
 from dotenv import load_dotenv
 from pathlib import Path
 
+sys.path.append(str(Path('..', 'Simulator')))
+import validator
+from commands import answer_message
+
 env_path = Path('..', '.env')
 load_dotenv(dotenv_path=env_path)
 
@@ -29,12 +34,10 @@ def validate_response_fields(response_message):
         
         payload = response[2]
 
-        if not isinstance(payload, dict):
-            print("Validation failed: Payload is not a valid JSON object.")
-            return False
-        
-        if "currentTime" not in payload:
-            print("Validation failed: 'currentTime' is missing in response payload.")
+        errors = validator.validate_response("Heartbeat", payload)
+        if errors:
+            for error in errors:
+                print(f"Validation failed: {error}")
             return False
 
         print("Response validation successful.")
@@ -44,7 +47,12 @@ def validate_response_fields(response_message):
         return False
 
 def on_message(ws, message):
-    print(f"Received response: {message}")
+    reply = answer_message(message)
+    if reply is not None:
+        print(f"Answered server CALL {message} with {reply}")
+        ws.send(reply)
+        return
+    print(f"Received response after {(time.perf_counter() - ws.sent_at) * 1000:.1f} ms: {message}")
     if validate_response_fields(message):
         ws.close()
 
@@ -66,6 +74,7 @@ def on_open(ws):
     
     print(f"Request message loaded: {request_message}")
 
+    ws.sent_at = time.perf_counter()
     ws.send(json.dumps(request_message))
     print("Sent request")
 
@@ -0,0 +1,94 @@
+import random
+from collections import OrderedDict
+
+from clock import parse_timestamp
+
+# What a station knows about idTags without asking the central system
+# (OCPP 1.6 §3.5): the Local Authorization List the server sends with
+# SendLocalList, and a cache of the idTagInfo in every Authorize,
+# StartTransaction and StopTransaction answer. A driver whose idTag is known
+# and Accepted starts charging without an Authorize round trip. Expiry times
+# are epoch seconds, compared against the station's own clock.
+
+
+def tag_entry(id_tag_info):
+    # idTagInfo -> (status, expires at or None).
+    return id_tag_info.get("status"), parse_timestamp(id_tag_info.get("expiryDate"))
+
+
+class Authorization:
+    __slots__ = ('size', 'hit_ratio', 'rng', 'cache', 'local_list', 'list_version')
+
+    def __init__(self, size=32, hit_ratio=1.0, rng=None):
+        self.size = size
+        # Share of lookups that may be answered locally; the rest go to the
+        # central system, as if a driver with an unknown card had arrived.
+        self.hit_ratio = hit_ratio
+        # Shared between stations by default; a Random each would cost more than the cache.
+        self.rng = rng if rng is not None else random
+        self.cache = OrderedDict()
+        self.local_list = {}
+        self.list_version = 0
+
+    def remember(self, id_tag, id_tag_info):
+        if id_tag is None or not isinstance(id_tag_info, dict):
+            return
+        self.cache[id_tag] = tag_entry(id_tag_info)
+        self.cache.move_to_end(id_tag)
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+
+    def lookup(self, id_tag, now):
+        # The status known for id_tag, the local list before the cache, or
+        # None when it is unknown or has expired.
+        entry = self.local_list.get(id_tag)
+        if entry is None:
+            entry = self.cache.get(id_tag)
+            if entry is None:
+                return None
+            self.cache.move_to_end(id_tag)
+        status, expires = entry
+        if expires is not None and expires <= now:
+            return None
+        return status
+
+    def authorized(self, id_tag, now):
+        # Whether the station may skip Authorize for id_tag.
+        if self.hit_ratio < 1 and self.rng.random() >= self.hit_ratio:
+            return False
+        return self.lookup(id_tag, now) == "Accepted"
+
+    def send_local_list(self, payload):
+        version = payload["listVersion"]
+        entries = payload.get("localAuthorizationList") or ()
+        if payload["updateType"] == "Full":
+            self.local_list = {entry["idTag"]: tag_entry(entry["idTagInfo"])
+                               for entry in entries if "idTagInfo" in entry}
+        else:
+            if version <= self.list_version:
+                return {"status": "VersionMismatch"}
+            for entry in entries:
+                # A differential entry without idTagInfo removes the idTag.
+                if "idTagInfo" in entry:
+                    self.local_list[entry["idTag"]] = tag_entry(entry["idTagInfo"])
+                else:
+                    self.local_list.pop(entry["idTag"], None)
+        self.list_version = version
+        return {"status": "Accepted"}
+
+    def get_local_list_version(self, payload):
+        return {"listVersion": self.list_version}
+
+    def handlers(self):
+        # Server CALLs this station answers, for CallTracker.handlers.
+        return {
+            "SendLocalList": self.send_local_list,
+            "GetLocalListVersion": self.get_local_list_version,
+        }
+
+
+def add_arguments(parser):
+    parser.add_argument('--auth-cache', type=int, default=0, metavar='SIZE',
+                        help="keep an idTag cache of this size per station and skip Authorize for known tags (0 = off)")
+    parser.add_argument('--auth-hit-ratio', type=float, default=1.0,
+                        help="share of Authorize steps that may be answered from the cache or local list")
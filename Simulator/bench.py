@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+
+import codec
+import load
+from report import RunReport
+
+RESULTS_FORMAT_VERSION = 1
+
+# Named workloads: a scenario file plus the load.py options it runs with.
+WORKLOADS = {
+    "boot-storm": {
+        "scenario": "workloads/boot_storm.json",
+        "options": ["--stations", "500", "--ramp-up", "0", "--concurrency", "500"],
+    },
+    "authorize-burst": {
+        "scenario": "workloads/authorize_burst.json",
+        "options": ["--stations", "50", "--ramp-up", "0", "--in-flight", "10"],
+    },
+    "heartbeat": {
+        "scenario": "workloads/heartbeat.json",
+        "options": ["--stations", "200", "--ramp-up", "0", "--loop", "--duration", "10"],
+    },
+    "charging-session": {
+        "scenario": "../All/valid.json",
+        "options": ["--stations", "200", "--ramp-up", "0", "--clock-speed", "max"],
+    },
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def workload_settings(name, url, subprotocol):
+    workload = WORKLOADS[name]
+    return load.build_parser().parse_args(
+        [workload["scenario"], "--url", url, "--subprotocol", subprotocol] + workload["options"])
+
+
+def run_workload(name, settings, warmup, iterations):
+    request_messages = load.load_request_messages(settings.request_file)
+    station_ids = load.charge_point_ids(settings.stations, settings.id_prefix)
+
+    for number in range(warmup):
+        print(f"  warmup {number + 1}/{warmup}")
+        asyncio.run(load.run_load(request_messages, station_ids, settings))
+
+    total = RunReport()
+    throughputs = []
+    for number in range(iterations):
+        report = asyncio.run(load.run_load(request_messages, station_ids, settings))
+        throughput = report.total_latency().count / (report.elapsed_seconds or 1)
+        throughputs.append(round(throughput, 2))
+        print(f"  iteration {number + 1}/{iterations}: {throughput:.1f} msg/s")
+        total.merge(report)
+
+    latency = total.total_latency()
+    counters = total.counters
+    return {
+        "iterations": iterations,
+        "warmup": warmup,
+        "throughput_per_s": statistics.median(throughputs),
+        "throughput_iterations": throughputs,
+        "p50_ms": round(latency.percentile(50) / 1000, 3),
+        "p90_ms": round(latency.percentile(90) / 1000, 3),
+        "p99_ms": round(latency.percentile(99) / 1000, 3),
+        "p99_9_ms": round(latency.percentile(99.9) / 1000, 3),
+        "responses": latency.count,
+        "errors": counters['validation_failed'] + counters['call_timeouts'] + counters['connect_failed']
+        + counters['connection_lost'],
+    }
+
+
+def compare(results, baseline, max_throughput_drop, max_p99_increase):
+    # Returns a list of regressions, in percent against the baseline.
+    regressions = []
+    for name, result in results["workloads"].items():
+        before = baseline["workloads"].get(name)
+        if before is None:
+            print(f"{name}: no baseline")
+            continue
+
+        throughput_change = (result["throughput_per_s"] - before["throughput_per_s"]) / (before["throughput_per_s"] or 1) * 100
+        p99_change = (result["p99_ms"] - before["p99_ms"]) / (before["p99_ms"] or 1) * 100
+        print(f"{name}: throughput {before['throughput_per_s']:.1f} -> {result['throughput_per_s']:.1f} msg/s "
+              f"({throughput_change:+.1f}%), p99 {before['p99_ms']:.2f} -> {result['p99_ms']:.2f} ms ({p99_change:+.1f}%)")
+
+        if throughput_change < -max_throughput_drop:
+            regressions.append(f"{name}: throughput dropped {-throughput_change:.1f}% (limit {max_throughput_drop}%)")
+        if p99_change > max_p99_increase:
+            regressions.append(f"{name}: p99 latency rose {p99_change:.1f}% (limit {max_p99_increase}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run named workloads against the central system and compare to a baseline.")
+    parser.add_argument('workloads', nargs='*', default=list(WORKLOADS), help=f"any of: {', '.join(WORKLOADS)}")
+    parser.add_argument('--warmup', type=int, default=1, help="unmeasured iterations per workload")
+    parser.add_argument('--iterations', type=int, default=3, help="measured iterations per workload")
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--baseline', help="compare against this results file and fail on regressions")
+    parser.add_argument('--max-throughput-drop', type=float, default=10, help="allowed throughput drop, in percent")
+    parser.add_argument('--max-p99-increase', type=float, default=20, help="allowed p99 latency increase, in percent")
+    parser.add_argument('--url', default=load.url)
+    parser.add_argument('--subprotocol', default=load.socketProtocol)
+    args = parser.parse_args()
+
+    unknown = [name for name in args.workloads if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"unknown workload(s): {', '.join(unknown)}")
+
+    results = {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "url": args.url,
+        "python": platform.python_version(),
+        "json_backend": codec.BACKEND,
+        "workloads": {},
+    }
+    for name in args.workloads:
+        print(f"Running {name}")
+        settings = workload_settings(name, args.url, args.subprotocol)
+        results["workloads"][name] = run_workload(name, settings, args.warmup, args.iterations)
+        result = results["workloads"][name]
+        print(f"{name}: {result['throughput_per_s']:.1f} msg/s, p50 {result['p50_ms']:.2f} ms, "
+              f"p99 {result['p99_ms']:.2f} ms, {result['errors']} errors\n")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        if baseline.get("format_version") != RESULTS_FORMAT_VERSION:
+            print(f"Baseline format version {baseline.get('format_version')} is not {RESULTS_FORMAT_VERSION}")
+            sys.exit(2)
+
+        regressions = compare(results, baseline, args.max_throughput_drop, args.max_p99_increase)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
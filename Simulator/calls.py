@@ -0,0 +1,166 @@
+import asyncio
+import time
+
+import websockets
+
+import codec
+import validator
+
+CALL = 2
+CALLRESULT = 3
+CALLERROR = 4
+
+SERVER_CALL_ERRORS = {"NotImplemented": 'server_calls_unsupported', "FormationViolation": 'server_calls_invalid'}
+
+
+def answer_call(handlers, frame):
+    # The response frame for a CALL from the central system, answered by the
+    # handler registered for its action: handler(payload) -> response payload.
+    unique_id, action, payload = frame[1], frame[2], frame[3]
+    if not isinstance(action, str) or not isinstance(payload, dict):
+        return [CALLERROR, unique_id, "FormationViolation", "action must be a string and the payload an object", {}]
+    handler = handlers.get(action)
+    if handler is None:
+        return [CALLERROR, unique_id, "NotImplemented", f"{action} is not supported", {}]
+    errors = validator.validate_request(action, payload)
+    if errors:
+        return [CALLERROR, unique_id, "FormationViolation", errors[0], {}]
+    try:
+        return [CALLRESULT, unique_id, handler(payload)]
+    except Exception as e:
+        return [CALLERROR, unique_id, "InternalError", f"{type(e).__name__}: {e}", {}]
+
+
+class CallTracker:
+    # Outstanding CALLs of one connection, keyed by uniqueId. Responses are
+    # matched by uniqueId rather than by arrival order, so a server that
+    # answers out of order is counted instead of silently misattributed.
+    __slots__ = ('ws', 'report', 'prefix', 'sequence', 'outstanding', 'reader', 'handlers')
+
+    def __init__(self, ws, report, prefix):
+        self.ws = ws
+        self.report = report
+        self.prefix = prefix
+        self.sequence = 0
+        self.outstanding = {}
+        self.reader = None
+        # Action -> handler(payload) for CALLs from the central system; see answer_call.
+        self.handlers = {}
+
+    def start(self):
+        self.reader = asyncio.create_task(self.read_loop())
+
+    async def stop(self):
+        if self.reader is not None:
+            self.reader.cancel()
+            await asyncio.gather(self.reader, return_exceptions=True)
+
+    def next_unique_id(self):
+        self.sequence += 1
+        return f"{self.prefix}-{self.sequence}"
+
+    async def send(self, unique_id, action, data):
+        # data is the encoded frame, as bytes from a MessageTemplate or a str.
+        future = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        self.outstanding[unique_id] = (future, action, started)
+        try:
+            await self.ws.send(data, text=True)
+        except BaseException:
+            self.outstanding.pop(unique_id, None)
+            raise
+        self.report.record_phase('send', time.perf_counter() - started)
+        counters = self.report.counters
+        counters['sent'] += 1
+        counters['in_flight'] += 1
+        self.report.sent[action] += 1
+        return future
+
+    async def wait(self, unique_id, future, timeout):
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if self.outstanding.pop(unique_id, None) is not None:
+                self.report.counters['in_flight'] -= 1
+
+    async def call(self, action, payload, timeout):
+        # Sends one CALL and waits for its answer. Returns the response frame,
+        # or None when it timed out.
+        unique_id = self.next_unique_id()
+        future = await self.send(unique_id, action, codec.dumps_bytes([CALL, unique_id, action, payload]))
+        try:
+            return await self.wait(unique_id, future, timeout)
+        except asyncio.TimeoutError:
+            self.report.counters['call_timeouts'] += 1
+            return None
+
+    def skips(self, action):
+        # Whether the scenario step for this action should not be sent at all.
+        return False
+
+    def resolve(self, response):
+        counters = self.report.counters
+        unique_id = response[1]
+        if unique_id not in self.outstanding:
+            counters['unmatched_responses'] += 1
+            return
+        if unique_id != next(iter(self.outstanding)):
+            counters['reordered_responses'] += 1
+
+        future, action, sent_at = self.outstanding.pop(unique_id)
+        counters['in_flight'] -= 1
+        latency = time.perf_counter() - sent_at
+        self.report.record_latency(action, latency)
+        self.report.record_phase('wait', latency)
+        if not future.done():
+            future.set_result(response)
+
+    def handle_message(self, message):
+        # Resolves responses. Returns the frame when it is a CALL from the
+        # central system, for the read loop to answer.
+        counters = self.report.counters
+        started = time.perf_counter()
+        try:
+            frame = codec.loads(message)
+        except codec.DecodeError:
+            counters['received'] += 1
+            counters['error: response is not valid JSON'] += 1
+            return
+        self.report.record_phase('decode', time.perf_counter() - started)
+        if isinstance(frame, list) and len(frame) == 4 and frame[0] == CALL and isinstance(frame[1], str):
+            # answer_call rejects a malformed action or payload itself.
+            return frame
+
+        counters['received'] += 1
+        if not isinstance(frame, list) or len(frame) < 3 or not isinstance(frame[1], str):
+            counters['error: response is not an OCPP frame'] += 1
+            return
+        if frame[0] in (CALLRESULT, CALLERROR):
+            self.resolve(frame)
+        else:
+            counters['error: response is not an OCPP frame'] += 1
+
+    async def answer(self, frame):
+        received_at = time.time()
+        started = time.perf_counter()
+        response = answer_call(self.handlers, frame)
+        counters = self.report.counters
+        counters['server_calls'] += 1
+        if response[0] == CALLERROR:
+            counters[SERVER_CALL_ERRORS.get(response[2], 'server_calls_failed')] += 1
+        await self.ws.send(codec.dumps(response))
+        if isinstance(frame[2], str):
+            self.report.record_server_call(frame[2], received_at, time.perf_counter() - started)
+
+    async def read_loop(self):
+        try:
+            async for message in self.ws:
+                frame = self.handle_message(message)
+                if frame is not None:
+                    await self.answer(frame)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            for future, _, _ in self.outstanding.values():
+                if not future.done():
+                    future.set_exception(websockets.exceptions.ConnectionClosed(None, None))
@@ -0,0 +1,149 @@
+import asyncio
+import copy
+import random
+
+from calls import CallTracker
+
+# Noise a flaky cellular link or a buggy station puts on the wire, injected
+# into the CallTracker every CALL goes through. All rates are fractions:
+# of CALLs for delay/duplicate/malformed, of transactions for drop/abandon.
+
+
+class Chaos:
+    __slots__ = ('rng', 'drop', 'delay', 'max_delay', 'duplicate', 'malformed', 'abandon')
+
+    def __init__(self, drop=0, delay=0, max_delay=2, duplicate=0, malformed=0, abandon=0, seed=None):
+        self.rng = random.Random(seed)
+        self.drop = drop
+        self.delay = delay
+        self.max_delay = max_delay
+        self.duplicate = duplicate
+        self.malformed = malformed
+        self.abandon = abandon
+
+    @classmethod
+    def from_settings(cls, settings):
+        chaos = cls(settings.chaos_drop, settings.chaos_delay, settings.chaos_max_delay, settings.chaos_duplicate,
+                    settings.chaos_malformed, settings.chaos_abandon, settings.chaos_seed)
+        return chaos if chaos.enabled() else None
+
+    def enabled(self):
+        return any((self.drop, self.delay, self.duplicate, self.malformed, self.abandon))
+
+    def happens(self, rate):
+        return rate and self.rng.random() < rate
+
+
+class ChaosTracker(CallTracker):
+    __slots__ = ('chaos',)
+
+    def __init__(self, ws, report, prefix, chaos):
+        super().__init__(ws, report, prefix)
+        self.chaos = chaos
+
+    async def send(self, unique_id, action, data):
+        chaos = self.chaos
+        counters = self.report.counters
+        if chaos.happens(chaos.delay):
+            # Held back before the send, so response latency still only measures the server.
+            counters['chaos_delayed'] += 1
+            await asyncio.sleep(chaos.rng.uniform(0, chaos.max_delay))
+        if chaos.happens(chaos.malformed):
+            # Half a frame ahead of the real one, as if the link cut it short.
+            counters['chaos_malformed'] += 1
+            text = data.decode('utf-8', 'ignore') if isinstance(data, bytes) else data
+            await self.ws.send(text[:len(text) // 2])
+
+        future = await super().send(unique_id, action, data)
+        if chaos.happens(chaos.duplicate):
+            # The same uniqueId again, like a station retrying a CALL it thinks was lost.
+            counters['chaos_duplicated'] += 1
+            await self.ws.send(data, text=True)
+        return future
+
+    def resolve(self, response):
+        call = self.outstanding.get(response[1])
+        super().resolve(response)
+        if call is not None and call[1] == "StartTransaction" and self.chaos.happens(self.chaos.drop):
+            # Drop the connection mid-transaction, without a close handshake.
+            self.report.counters['chaos_dropped'] += 1
+            asyncio.get_running_loop().call_soon(self.ws.transport.abort)
+
+    def skips(self, action):
+        if action == "StopTransaction" and self.chaos.happens(self.chaos.abandon):
+            self.report.counters['chaos_abandoned'] += 1
+            return True
+        return False
+
+
+def add_arguments(parser):
+    parser.add_argument('--chaos-drop', type=float, default=0, help="share of transactions whose connection is dropped")
+    parser.add_argument('--chaos-delay', type=float, default=0, help="share of CALLs held back before sending")
+    parser.add_argument('--chaos-max-delay', type=float, default=2, help="longest hold-back, in seconds")
+    parser.add_argument('--chaos-duplicate', type=float, default=0, help="share of CALLs sent twice with the same uniqueId")
+    parser.add_argument('--chaos-malformed', type=float, default=0, help="share of CALLs preceded by a truncated frame")
+    parser.add_argument('--chaos-abandon', type=float, default=0,
+                        help="share of transactions never stopped (StartTransaction without StopTransaction)")
+    parser.add_argument('--chaos-seed', type=int)
+
+
+def error_rates(report):
+    counters = report.counters
+    sent = counters['sent'] or 1
+    return {
+        "timeouts": counters['call_timeouts'] / sent,
+        "validation failures": counters['validation_failed'] / sent,
+        "unmatched responses": counters['unmatched_responses'] / sent,
+        "lost connections": counters['connection_lost'] / (counters['connected'] or 1),
+    }
+
+
+def print_degradation(clean, noisy):
+    print(f"{'':<24}{'clean':>12}{'chaos':>12}")
+    for name, clean_rate in error_rates(clean).items():
+        print(f"{name:<24}{clean_rate * 100:>11.2f}%{error_rates(noisy)[name] * 100:>11.2f}%")
+    clean_rows = {row['action']: row for row in clean.summary_rows()}
+    for row in noisy.summary_rows():
+        before = clean_rows.get(row['action'])
+        if before is None:
+            continue
+        for field in ('p50_ms', 'p99_ms'):
+            label = f"{row['action']} {field[:-3]}"
+            print(f"{label:<24}{before[field]:>9.2f} ms{row[field]:>9.2f} ms")
+
+
+def main():
+    # Imported here: load.py builds its trackers from this module.
+    import load
+
+    parser = load.build_parser()
+    parser.description = "Run a scenario clean and then with injected faults, and compare how the server copes."
+    settings = parser.parse_args()
+
+    request_messages = load.load_request_messages(settings.request_file)
+    station_ids = load.charge_point_ids(settings.stations, settings.id_prefix)
+    if Chaos.from_settings(settings) is None:
+        parser.error("set at least one --chaos-* rate")
+
+    clean_settings = copy.copy(settings)
+    for name in ('chaos_drop', 'chaos_delay', 'chaos_duplicate', 'chaos_malformed', 'chaos_abandon'):
+        setattr(clean_settings, name, 0)
+
+    print(f"Clean run: {settings.stations} charge points against {settings.url}")
+    clean = asyncio.run(load.run_load(request_messages, station_ids, clean_settings))
+    print(f"Chaos run: {settings.stations} charge points against {settings.url}")
+    noisy = asyncio.run(load.run_load(request_messages, station_ids, settings))
+
+    print()
+    load.print_results(noisy)
+    print()
+    counters = noisy.counters
+    print(f"Injected: {counters['chaos_dropped']} dropped connections, {counters['chaos_delayed']} delayed, "
+          f"{counters['chaos_duplicated']} duplicated, {counters['chaos_malformed']} malformed, "
+          f"{counters['chaos_abandoned']} abandoned transactions\n")
+    print_degradation(clean, noisy)
+    load.write_reports(noisy, settings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import asyncio
+import calendar
+import time
+
+# OCPP timestamps are UTC ISO 8601 strings. Formatting one with
+# datetime.strftime for every message is slow, so the clock caches the
+# "YYYY-MM-DDTHH:MM:" part per minute and only appends seconds and millis.
+
+PREFIX_CACHE_SIZE = 4096
+
+
+class OcppClock:
+    __slots__ = ('prefixes',)
+
+    def __init__(self):
+        self.prefixes = {}
+
+    def now(self):
+        return time.time()
+
+    def format(self, epoch, suffix='Z'):
+        whole, millis = divmod(round(epoch * 1000), 1000)
+        minute, second = divmod(whole, 60)
+        prefix = self.prefixes.get(minute)
+        if prefix is None:
+            if len(self.prefixes) >= PREFIX_CACHE_SIZE:
+                self.prefixes.clear()
+            prefix = self.prefixes[minute] = time.strftime('%Y-%m-%dT%H:%M:', time.gmtime(minute * 60))
+        return f"{prefix}{second:02d}.{millis:03d}{suffix}"
+
+    def timestamp(self, suffix='Z'):
+        return self.format(self.now(), suffix)
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+    def sleep_blocking(self, seconds):
+        time.sleep(seconds)
+
+
+class VirtualClock(OcppClock):
+    # Runs `speed` times faster than the wall clock; speed None skips every
+    # sleep outright. Each simulated station gets its own, so one station
+    # sleeping does not move the others' time.
+    __slots__ = ('started', 'real_started', 'speed', 'skipped')
+
+    def __init__(self, speed=None, start=None, prefixes=None):
+        super().__init__()
+        if prefixes is not None:
+            self.prefixes = prefixes
+        self.real_started = time.monotonic()
+        self.started = time.time() if start is None else start
+        self.speed = speed
+        self.skipped = 0.0
+
+    def now(self):
+        elapsed = time.monotonic() - self.real_started
+        return self.started + elapsed * (self.speed or 1) + self.skipped
+
+    async def sleep(self, seconds):
+        if self.speed is None:
+            self.skipped += seconds
+            await asyncio.sleep(0)
+        else:
+            await asyncio.sleep(seconds / self.speed)
+
+    def sleep_blocking(self, seconds):
+        if self.speed is None:
+            self.skipped += seconds
+        else:
+            time.sleep(seconds / self.speed)
+
+
+WALL_CLOCK = OcppClock()
+
+
+def parse_timestamp(value):
+    # "2024-07-29T08:26:58.5397103Z" -> epoch seconds. Accepts any number of
+    # fraction digits and a Z or +HH:MM offset; returns None if it is not one.
+    if not isinstance(value, str) or len(value) < 19 or value[10] != 'T':
+        return None
+    try:
+        whole = calendar.timegm(time.strptime(value[:19], '%Y-%m-%dT%H:%M:%S'))
+    except ValueError:
+        return None
+    rest = value[19:]
+    fraction = 0.0
+    if rest.startswith('.'):
+        digits = len(rest) - len(rest[1:].lstrip('0123456789'))
+        if digits > 1:
+            fraction = float(rest[:digits])
+        rest = rest[digits:]
+    if rest in ('Z', ''):
+        return whole + fraction
+    if len(rest) == 6 and rest[0] in '+-' and rest[3] == ':' and rest[1:3].isdigit() and rest[4:].isdigit():
+        offset = int(rest[1:3]) * 3600 + int(rest[4:]) * 60
+        return whole + fraction - offset if rest[0] == '+' else whole + fraction + offset
+    return None
+
+
+def parse_speed(value):
+    # "max" runs as fast as possible, a number is a speed-up factor.
+    if value is None or value == '':
+        return None, False
+    if value == 'max':
+        return None, True
+    return float(value), True
+
+
+def make_clock(speed_setting, start=None):
+    speed, virtual = parse_speed(speed_setting)
+    if not virtual:
+        return WALL_CLOCK
+    return VirtualClock(speed, start, WALL_CLOCK.prefixes)
@@ -0,0 +1,114 @@
+import copy
+import json
+import os
+
+# JSON backend for every frame we send or receive: orjson when it is
+# installed, then ujson, then the standard library. OCPP_JSON_BACKEND=json
+# (or ujson/orjson) forces one, e.g. to compare them in a benchmark.
+
+BACKENDS = ('orjson', 'ujson', 'json')
+
+
+def load_backend(name):
+    if name == 'orjson':
+        import orjson
+
+        def dumps_bytes(obj):
+            return orjson.dumps(obj)
+
+        def dumps(obj):
+            return orjson.dumps(obj).decode('utf-8')
+
+        return dumps, dumps_bytes, orjson.loads
+
+    if name == 'ujson':
+        import ujson
+
+        def dumps(obj):
+            return ujson.dumps(obj, ensure_ascii=False)
+
+        def dumps_bytes(obj):
+            return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+        return dumps, dumps_bytes, ujson.loads
+
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def dumps(obj):
+        return encoder.encode(obj)
+
+    def dumps_bytes(obj):
+        return encoder.encode(obj).encode('utf-8')
+
+    return dumps, dumps_bytes, json.loads
+
+
+def select_backend(preferred=None):
+    names = [preferred] if preferred else BACKENDS
+    for name in names:
+        try:
+            return (name,) + load_backend(name)
+        except ImportError:
+            continue
+    return ('json',) + load_backend('json')
+
+
+BACKEND, dumps, dumps_bytes, loads = select_backend(os.getenv('OCPP_JSON_BACKEND'))
+
+# All three backends raise a ValueError subclass on bad input.
+DecodeError = ValueError
+
+
+def set_path(message, path, value):
+    target = message
+    for key in path[:-1]:
+        target = target[key]
+    target[path[-1]] = value
+
+
+def replaced(message, path, value):
+    # A copy of message with value at path. Only the lists and dicts along
+    # the path are copied; the rest is shared with message.
+    copied = list(message) if isinstance(message, list) else dict(message)
+    copied[path[0]] = value if len(path) == 1 else replaced(message[path[0]], path[1:], value)
+    return copied
+
+
+class MessageTemplate:
+    # A frame serialized once, with the variable fields cut out. render()
+    # only encodes those values and joins them with the fixed byte chunks.
+    __slots__ = ('chunks', 'names')
+
+    def __init__(self, message, fields):
+        marked = copy.deepcopy(message)
+        markers = {}
+        for name, path in fields.items():
+            marker = f"@@{name}@@"
+            set_path(marked, path, marker)
+            markers[dumps_bytes(marker)] = name
+
+        encoded = dumps_bytes(marked)
+        chunks = []
+        names = []
+        position = 0
+        while True:
+            found = [(encoded.find(marker, position), marker) for marker in markers]
+            found = [(index, marker) for index, marker in found if index >= 0]
+            if not found:
+                break
+            index, marker = min(found)
+            chunks.append(encoded[position:index])
+            names.append(markers[marker])
+            position = index + len(marker)
+        chunks.append(encoded[position:])
+
+        self.chunks = tuple(chunks)
+        self.names = tuple(names)
+
+    def render(self, values):
+        chunks = self.chunks
+        parts = [chunks[0]]
+        for index, name in enumerate(self.names, 1):
+            parts.append(dumps_bytes(values[name]))
+            parts.append(chunks[index])
+        return b''.join(parts)
@@ -0,0 +1,220 @@
+import asyncio
+from functools import partial
+
+import websockets
+
+import codec
+import flow
+from calls import CALL, answer_call
+from session import ChargePointSession
+from transactions import ENERGY_MEASURAND
+
+# What a station does with CALLs from the central system. A handler takes
+# the station's StationCommands and the request payload and returns the
+# response payload straight away. The work it accepted (a transaction to
+# start or stop, a message to send) follows as a task on the connection,
+# the way a real station answers first and acts afterwards. Handlers are
+# looked up by action in HANDLERS; pass another dict to handlers() to add or
+# replace one.
+
+BOOT_NOTIFICATION = {"chargePointVendor": "Imagine BV", "chargePointModel": "FC42"}
+
+# Key -> (value, readonly).
+DEFAULT_CONFIGURATION = {
+    "AuthorizeRemoteTxRequests": ("false", False),
+    "ConnectionTimeOut": ("60", False),
+    "HeartbeatInterval": ("900", False),
+    "LocalAuthListEnabled": ("true", False),
+    "MeterValueSampleInterval": ("60", False),
+    "NumberOfConnectors": ("1", True),
+    "SupportedFeatureProfiles": ("Core,LocalAuthListManagement,RemoteTrigger", True),
+}
+INTEGER_KEYS = {"ConnectionTimeOut", "HeartbeatInterval", "MeterValueSampleInterval"}
+
+
+def current_meter(session, connector):
+    # The connector's energy register: the last reading of its transaction
+    # the run has seen, else what the connector itself remembers.
+    if connector.transaction_id is not None and session.transactions is not None:
+        record = session.transactions.open.get(connector.transaction_id)
+        if record is not None and record.last_meter is not None:
+            return record.last_meter
+    return connector.meter_stop if connector.meter_stop is not None else connector.meter_start or 0
+
+
+class StationCommands:
+    # One connection's command state. session is the scenario run in
+    # progress; load.py swaps it when the station starts its next one.
+    # Without a tracker (the websocket-client scripts) nothing can be sent
+    # afterwards, so commands that need to are rejected.
+    __slots__ = ('tracker', 'session', 'timeout', 'configuration', 'tasks')
+
+    def __init__(self, tracker, session, timeout=30):
+        self.tracker = tracker
+        self.session = session
+        self.timeout = timeout
+        # Changed keys only; the rest come from DEFAULT_CONFIGURATION.
+        self.configuration = {}
+        self.tasks = set()
+
+    def handlers(self, handlers=None):
+        return {action: partial(handler, self) for action, handler in (handlers or HANDLERS).items()}
+
+    def later(self, function, *args):
+        # Returns whether the work was scheduled.
+        if self.tracker is None:
+            return False
+        task = asyncio.create_task(function(*args))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return True
+
+    async def stop(self):
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def value(self, key):
+        return self.configuration.get(key, DEFAULT_CONFIGURATION[key][0])
+
+    async def send(self, action, payload):
+        # A request a command asked for, checked like a scenario step.
+        counters = self.tracker.report.counters
+        try:
+            response = await self.tracker.call(action, payload, self.timeout)
+        except websockets.exceptions.ConnectionClosed:
+            counters['calls_lost'] += 1
+            return
+        if response is None:
+            return
+        error = flow.validate_response_fields(self.session, [CALL, response[1], action, payload], response)
+        if error is not None:
+            counters['validation_failed'] += 1
+            counters['error: ' + error] += 1
+
+    async def start_transaction(self, connector_id, id_tag):
+        session = self.session
+        connector = session.select(connector_id)
+        meter = current_meter(session, connector)
+        connector.reset()
+        connector.started_at = connector.timestamp = session.clock.now()
+        connector.meter_start = meter
+        # The central system asked for it, so the idTag counts as authorized.
+        connector.id_tag = id_tag
+        await self.send("StartTransaction", {"connectorId": connector_id, "idTag": id_tag, "meterStart": int(meter),
+                                             "timestamp": session.clock.format(connector.started_at)})
+
+    async def send_triggered(self, requested, connector_id):
+        # Built when it is sent, so it reports the connector as it is by then.
+        await self.send(requested, TRIGGERED_MESSAGES[requested](self.session, connector_id))
+
+    async def stop_transaction(self, connector):
+        meter = current_meter(self.session, connector)
+        await self.send("StopTransaction", {"transactionId": connector.transaction_id, "meterStop": int(meter),
+                                            "timestamp": self.session.clock.timestamp(), "reason": "Remote"})
+
+
+def remote_start_transaction(commands, payload):
+    connector_id = payload.get("connectorId", 1)
+    if connector_id < 1 or commands.session.get(connector_id).transaction_id is not None:
+        return {"status": "Rejected"}
+    if not commands.later(commands.start_transaction, connector_id, payload["idTag"]):
+        return {"status": "Rejected"}
+    return {"status": "Accepted"}
+
+
+def remote_stop_transaction(commands, payload):
+    connector = commands.session.active_transaction(payload["transactionId"])
+    if connector is None or not commands.later(commands.stop_transaction, connector):
+        return {"status": "Rejected"}
+    return {"status": "Accepted"}
+
+
+def change_configuration(commands, payload):
+    key, value = payload["key"], payload["value"]
+    if key not in DEFAULT_CONFIGURATION:
+        return {"status": "NotSupported"}
+    if DEFAULT_CONFIGURATION[key][1] or (key in INTEGER_KEYS and not value.isdigit()):
+        return {"status": "Rejected"}
+    commands.configuration[key] = value
+    return {"status": "Accepted"}
+
+
+def get_configuration(commands, payload):
+    keys = payload.get("key") or list(DEFAULT_CONFIGURATION)
+    response = {"configurationKey": [{"key": key, "readonly": DEFAULT_CONFIGURATION[key][1], "value": commands.value(key)}
+                                     for key in keys if key in DEFAULT_CONFIGURATION]}
+    unknown = [key for key in keys if key not in DEFAULT_CONFIGURATION]
+    if unknown:
+        response["unknownKey"] = unknown
+    return response
+
+
+def triggered_boot_notification(session, connector_id):
+    # The station's own BootNotification from the scenario, if it has one.
+    for step in session.steps:
+        if step.action == "BootNotification":
+            return step.message[3]
+    return BOOT_NOTIFICATION
+
+
+def triggered_status_notification(session, connector_id):
+    connector = session.get(connector_id or 0)
+    return {"connectorId": connector.connector_id, "errorCode": "NoError", "status": connector.status or "Available"}
+
+
+def triggered_meter_values(session, connector_id):
+    connector = session.get(connector_id or 1)
+    meter = current_meter(session, connector)
+    payload = {"connectorId": connector.connector_id, "meterValue": [{
+        "timestamp": session.clock.timestamp(),
+        "sampledValue": [{"value": str(int(meter)), "context": "Trigger", "measurand": ENERGY_MEASURAND, "unit": "Wh"}],
+    }]}
+    if connector.transaction_id is not None:
+        payload["transactionId"] = connector.transaction_id
+    return payload
+
+
+# requestedMessage -> builder(session, connectorId) of the request to send.
+TRIGGERED_MESSAGES = {
+    "BootNotification": triggered_boot_notification,
+    "DiagnosticsStatusNotification": lambda session, connector_id: {"status": "Idle"},
+    "FirmwareStatusNotification": lambda session, connector_id: {"status": "Idle"},
+    "Heartbeat": lambda session, connector_id: {},
+    "MeterValues": triggered_meter_values,
+    "StatusNotification": triggered_status_notification,
+}
+
+
+def trigger_message(commands, payload):
+    requested = payload["requestedMessage"]
+    if requested not in TRIGGERED_MESSAGES:
+        return {"status": "NotImplemented"}
+    if payload.get("connectorId", 0) < 0 \
+            or not commands.later(commands.send_triggered, requested, payload.get("connectorId")):
+        return {"status": "Rejected"}
+    return {"status": "Accepted"}
+
+
+HANDLERS = {
+    "RemoteStartTransaction": remote_start_transaction,
+    "RemoteStopTransaction": remote_stop_transaction,
+    "ChangeConfiguration": change_configuration,
+    "GetConfiguration": get_configuration,
+    "TriggerMessage": trigger_message,
+}
+
+
+def answer_message(message, handlers=None):
+    # For the websocket-client scripts, which read one frame at a time: the
+    # response to send when message is a CALL from the central system, or
+    # None when it is anything else.
+    try:
+        frame = codec.loads(message)
+    except codec.DecodeError:
+        return None
+    if not isinstance(frame, list) or len(frame) != 4 or frame[0] != CALL or not isinstance(frame[1], str):
+        return None
+    if handlers is None:
+        handlers = StationCommands(None, ChargePointSession("", ())).handlers()
+    return codec.dumps(answer_call(handlers, frame))
@@ -0,0 +1,50 @@
+# ChargePointStatus transitions allowed by OCPP 1.6 (section 4.9,
+# StatusNotification). Repeating the current status is always allowed, and a
+# connector with no status yet (just booted) may report anything.
+TRANSITIONS = {
+    "Available": {"Preparing", "Charging", "SuspendedEV", "SuspendedEVSE", "Reserved", "Unavailable", "Faulted"},
+    "Preparing": {"Available", "Charging", "SuspendedEV", "SuspendedEVSE", "Finishing", "Faulted"},
+    "Charging": {"Available", "SuspendedEV", "SuspendedEVSE", "Finishing", "Unavailable", "Faulted"},
+    "SuspendedEV": {"Available", "Charging", "SuspendedEVSE", "Finishing", "Unavailable", "Faulted"},
+    "SuspendedEVSE": {"Available", "Charging", "SuspendedEV", "Finishing", "Unavailable", "Faulted"},
+    "Finishing": {"Available", "Preparing", "Unavailable", "Faulted"},
+    "Reserved": {"Available", "Preparing", "Unavailable", "Faulted"},
+    "Unavailable": {"Available", "Preparing", "Charging", "SuspendedEV", "SuspendedEVSE", "Faulted"},
+    "Faulted": {"Available", "Preparing", "Charging", "SuspendedEV", "SuspendedEVSE", "Finishing", "Reserved",
+                "Unavailable"},
+}
+
+# Connector 0 is the charge point as a whole.
+MAIN_CONTROLLER_STATUSES = {"Available", "Unavailable", "Faulted"}
+
+# Requests that belong to one connector's charging session. Authorize has no
+# connectorId, but a station authorizes for the connector the driver is at.
+CONNECTOR_ACTIONS = {"Authorize", "StartTransaction", "MeterValues", "StopTransaction"}
+
+
+def transition_error(connector_id, previous, status):
+    if connector_id == 0 and status not in MAIN_CONTROLLER_STATUSES:
+        return f"connector 0 cannot be '{status}'"
+    if previous is None or previous == status or status in TRANSITIONS.get(previous, ()):
+        return None
+    return f"illegal transition {previous} -> {status} on connector {connector_id}"
+
+
+def is_connector_step(step):
+    if step.action in CONNECTOR_ACTIONS:
+        return True
+    return step.action == "StatusNotification" and step.message[3].get("connectorId") != 0
+
+
+def split_scenario(steps):
+    # (station steps, connector steps): everything before the first
+    # connector-level request runs once per station, the rest once per
+    # connector. Steps that send nothing (a scenario's think times and
+    # variables) directly before it belong to the connectors, so each
+    # connector's driver gets drawn on its own.
+    for number, step in enumerate(steps):
+        if is_connector_step(step):
+            while number and steps[number - 1].action is None:
+                number -= 1
+            return steps[:number], steps[number:]
+    return steps, []
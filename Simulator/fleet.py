@@ -0,0 +1,95 @@
+import asyncio
+import copy
+import math
+import multiprocessing
+import os
+import time
+
+import load
+import profiling
+from report import RunReport
+
+
+def raise_open_file_limit():
+    # Every simulated station holds a socket; the default soft limit (often 1024) is far too low.
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def split_stations(station_ids, workers):
+    return [station_ids[worker::workers] for worker in range(workers)]
+
+
+def worker_settings(settings, workers):
+    shard = copy.copy(settings)
+    shard.ramp_up = settings.ramp_up / workers
+    shard.concurrency = max(1, math.ceil(settings.concurrency / workers))
+    return shard
+
+
+def run_worker(worker, request_messages, station_ids, settings):
+    raise_open_file_limit()
+    if settings.metrics_port:
+        # One endpoint per worker process: --metrics-port, +1, +2, ...
+        settings = copy.copy(settings)
+        settings.metrics_port += worker
+    # One profile per worker process: --profile-output.0, .1, ...
+    with profiling.profiled(settings.profile, f"{settings.profile_output}.{worker}", settings.profile_interval / 1000):
+        report = asyncio.run(load.run_load(request_messages, station_ids, settings))
+    return worker, os.getpid(), report
+
+
+def merge_results(worker_results):
+    total = RunReport()
+    for report in worker_results:
+        total.merge(report)
+    return total
+
+
+def run_fleet(request_messages, station_ids, settings, workers):
+    shards = split_stations(station_ids, workers)
+    shard_settings = worker_settings(settings, workers)
+    jobs = [(worker, request_messages, shard, shard_settings) for worker, shard in enumerate(shards) if shard]
+
+    with multiprocessing.Pool(len(jobs)) as pool:
+        return pool.starmap(run_worker, jobs)
+
+
+def print_worker_results(worker_results):
+    for worker, pid, report in worker_results:
+        results = report.counters
+        elapsed = report.elapsed_seconds or 1
+        print(f"Worker {worker} (pid {pid}): {results['connected']}/{results['stations_started']} connected, "
+              f"{results['sent']} sent ({results['sent'] / elapsed:.1f}/s), "
+              f"{results['validation_failed']} validation failures")
+
+
+def main():
+    parser = load.build_parser()
+    parser.description = "Split a fleet of simulated charge points across worker processes."
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    settings = parser.parse_args()
+
+    request_messages = load.load_request_messages(settings.request_file)
+    station_ids = load.charge_point_ids(settings.stations, settings.id_prefix)
+    workers = max(1, min(settings.workers, len(station_ids)))
+
+    print(f"Starting {settings.stations} charge points in {workers} workers against {settings.url}")
+    started = time.monotonic()
+    worker_results = run_fleet(request_messages, station_ids, settings, workers)
+    print(f"All workers finished in {time.monotonic() - started:.1f} s\n")
+
+    print_worker_results(worker_results)
+    print()
+    report = merge_results([report for _, _, report in worker_results])
+    load.print_results(report)
+    load.write_reports(report, settings)
+
+
+if __name__ == "__main__":
+    main()
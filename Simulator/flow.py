@@ -0,0 +1,246 @@
+import codec
+import validator
+from transactions import energy_reading
+
+
+# Fields the flow rewrites on every send, as paths into the frame.
+VARIABLE_FIELDS = {
+    "StartTransaction": {"timestamp": (3, "timestamp")},
+    "MeterValues": {"transactionId": (3, "transactionId"), "meterTimestamp": (3, "meterValue", 0, "timestamp")},
+    "StopTransaction": {"transactionId": (3, "transactionId"), "timestamp": (3, "timestamp"),
+                        "meterStop": (3, "meterStop")},
+}
+# Requests whose idTag belongs to the connector's driver; see connector_id_tag.
+ID_TAG_ACTIONS = {"Authorize", "StartTransaction", "StopTransaction"}
+ID_TAG_LENGTH = 20
+
+
+class Step:
+    # One scenario message, serialized once and shared by every station.
+    # bindings are (path, variable) pairs for fields filled in from the
+    # session's variables (see scenario.py); message then holds an example
+    # value in each of them.
+    __slots__ = ('action', 'message', 'template', 'error', 'bindings', 'id_tag_field')
+
+    def __init__(self, message, bindings=()):
+        self.action = message[2]
+        self.message = message
+        self.template = None
+        self.bindings = tuple((f"@{number}", path, variable) for number, (path, variable) in enumerate(bindings))
+        # The field holding the request's idTag: "idTag" when the scenario
+        # wrote one down, the binding's field when it comes from a variable.
+        self.id_tag_field = None
+        if self.action in ID_TAG_ACTIONS and isinstance(message[3], dict) and "idTag" in message[3]:
+            self.id_tag_field = next((field for field, path, _ in self.bindings if path == (3, "idTag")), "idTag")
+        self.error = validate_request_fields(message)
+        if self.error is None:
+            fields = dict(VARIABLE_FIELDS.get(self.action, {}), uniqueId=(1,))
+            if "connectorId" in message[3]:
+                fields["connectorId"] = (3, "connectorId")
+            if self.id_tag_field == "idTag":
+                fields["idTag"] = (3, "idTag")
+            for field, path, _ in self.bindings:
+                fields[field] = path
+            try:
+                self.template = codec.MessageTemplate(message, fields)
+            except (KeyError, IndexError, TypeError):
+                self.error = f"{self.action}: cannot patch {', '.join(fields)} into this message"
+
+    def request(self, values):
+        # The frame as sent, for response checks that look at request fields.
+        payload = self.message[3]
+        patched = {name: values[name] for name in ("connectorId", "idTag", "transactionId", "timestamp", "meterStop")
+                   if name in values}
+        if patched:
+            payload = dict(payload, **patched)
+        for field, path, _ in self.bindings:
+            payload = codec.replaced(payload, path[1:], values[field])
+        return [2, values["uniqueId"], self.action, payload]
+
+    def bind(self, values, variables):
+        for field, _, variable in self.bindings:
+            values[field] = variables[variable]
+
+    def id_tag(self, values):
+        return values.get(self.id_tag_field) if self.id_tag_field is not None else None
+
+
+def compile_scenario(request_messages):
+    return [Step(message) for message in request_messages]
+
+
+def connector_id_tag(id_tag, connector_id):
+    # Connectors charging at once need drivers of their own: a central
+    # system answers a second transaction on the same idTag with
+    # ConcurrentTx. Connector 1 keeps the scenario's idTag.
+    if connector_id is None or connector_id == 1 or not isinstance(id_tag, str):
+        return id_tag
+    suffix = f"-{connector_id}"
+    return id_tag[:ID_TAG_LENGTH - len(suffix)] + suffix
+
+
+def request_values(session, step, connector_id=None):
+    # The values patched into a request before it is sent: the step's
+    # variables, StartTransaction is backdated two hours, every MeterValues is
+    # one minute after the previous sample and StopTransaction carries the
+    # time the transaction was started. connector_id replaces the scenario's
+    # connectorId, for running the same steps on several connectors at once;
+    # their idTags are told apart with connector_id_tag.
+    # Returns (values, error); error is a string when the request cannot be sent.
+    action, payload = step.action, step.message[3]
+    clock = session.clock
+    spread = connector_id is not None
+    values = {}
+    if step.bindings:
+        step.bind(values, session.scope(connector_id))
+    if step.id_tag_field == "idTag":
+        values["idTag"] = connector_id_tag(payload["idTag"], connector_id)
+    if "connectorId" in payload:
+        if connector_id is None:
+            connector_id = payload["connectorId"]
+        values["connectorId"] = connector_id
+
+    if action == "Authorize":
+        # The connector the driver is at, which remembers whom it authorized.
+        connector = session.current() if connector_id is None else session.select(connector_id)
+        connector.id_tag = step.id_tag(values)
+        return values, None
+
+    if action == "StartTransaction":
+        driver = session.current()
+        connector = session.select(connector_id)
+        if not spread and connector is not driver:
+            # One driver at a time: the one who authorized walks to this connector.
+            connector.id_tag = driver.id_tag
+        connector.reset()
+        connector.started_at = clock.now()
+        connector.timestamp = connector.started_at - 2 * 3600
+        connector.meter_start = payload.get("meterStart", 0)
+        values["timestamp"] = clock.format(connector.timestamp, '7254Z')
+        return values, None
+
+    if action == "MeterValues":
+        connector = session.select(connector_id)
+        if connector.transaction_id is None:
+            return None, "missing transactionId for MeterValues"
+        if connector.timestamp is None:
+            return None, "missing timestamp for MeterValues"
+        connector.timestamp += 60
+        values["transactionId"] = connector.transaction_id
+        values["meterTimestamp"] = clock.format(connector.timestamp)
+        return values, None
+
+    if action == "StopTransaction":
+        connector = session.current() if connector_id is None else session.select(connector_id)
+        if connector.transaction_id is None:
+            return None, "missing transactionId for StopTransaction"
+        # meter_stop is set when MeterValues were streamed instead of taken from the scenario.
+        meter_stop = connector.meter_stop if connector.meter_stop is not None else payload.get("meterStop")
+        values["transactionId"] = connector.transaction_id
+        values["timestamp"] = clock.format(connector.started_at, '7254Z')
+        values["meterStop"] = meter_stop
+        return values, None
+
+    return values, None
+
+
+def validate_request_fields(request):
+    errors = validator.validate_request(request[2], request[3])
+    return errors[0] if errors else None
+
+
+def check_boot_notification(session, request, payload):
+    if payload.get("status") != "Accepted":
+        return f"status is '{payload.get('status')}'"
+    if payload.get("interval") != 900:
+        return f"interval is '{payload.get('interval')}'"
+
+
+def check_authorize(session, request, payload):
+    if payload["idTagInfo"].get("status") != "Accepted":
+        return f"idTagInfo status is '{payload['idTagInfo'].get('status')}'"
+    if session.authorization is not None:
+        session.authorization.remember(request[3].get("idTag"), payload["idTagInfo"])
+
+
+def check_start_transaction(session, request, payload):
+    if session.authorization is not None:
+        session.authorization.remember(request[3].get("idTag"), payload["idTagInfo"])
+    if payload["idTagInfo"].get("status") != "Accepted":
+        return f"idTagInfo status is '{payload['idTagInfo'].get('status')}'"
+    connector = session.get(request[3].get("connectorId", 1))
+    if connector.id_tag != request[3].get("idTag"):
+        return "idTag does not match the idTag the connector authorized"
+    active = session.active_transaction(payload["transactionId"])
+    if active is not None and active is not connector:
+        return f"transactionId {payload['transactionId']} is already active on connector {active.connector_id}"
+    connector.transaction_id = payload["transactionId"]
+    if session.transactions is not None:
+        return session.transactions.start(payload["transactionId"], session.charge_point_id, connector.connector_id,
+                                          request[3].get("idTag"), request[3].get("meterStart"))
+
+
+def check_status_notification(session, request, payload):
+    if payload != {}:
+        return "response should be empty"
+    return session.get(request[3].get("connectorId")).move(request[3].get("status"))
+
+
+def check_stop_transaction(session, request, payload):
+    if payload.get("errorCode") == 6:
+        return payload.get("ErrorDescription")
+    if session.authorization is not None and "idTagInfo" in payload:
+        session.authorization.remember(request[3].get("idTag"), payload["idTagInfo"])
+    connector = session.active_transaction(request[3].get("transactionId"))
+    if connector is not None:
+        connector.transaction_id = None
+    if session.transactions is not None:
+        return session.transactions.stop(request[3].get("transactionId"), session.charge_point_id,
+                                         request[3].get("meterStop"))
+
+
+def check_meter_values(session, request, payload):
+    if payload.get("Status") != "Accepted":
+        return f"status is '{payload.get('Status')}'"
+    connector = session.connectors.get(request[3].get("connectorId", 1))
+    if connector is None or connector.transaction_id != request[3].get("transactionId"):
+        return "transactionId does not match StartTransaction"
+    if session.transactions is not None and "transactionId" in request[3]:
+        return session.transactions.meter(request[3].get("transactionId"), session.charge_point_id,
+                                          energy_reading(request[3]))
+
+
+# Checks on top of the schema: what the flow in All/test.py expects from our
+# central system, and the idTag/transactionId it carries to later requests.
+RESPONSE_CHECKS = {
+    "BootNotification": check_boot_notification,
+    "Authorize": check_authorize,
+    "StartTransaction": check_start_transaction,
+    "StatusNotification": check_status_notification,
+    "StopTransaction": check_stop_transaction,
+    "MeterValues": check_meter_values,
+}
+
+
+def validate_response_fields(session, request, response):
+    # Checks an already decoded frame against the request it answers.
+    # Returns an error string or None.
+    action = request[2]
+
+    if not isinstance(response, list):
+        return f"{action}: response is not a JSON array"
+    if len(response) < 3:
+        return f"{action}: response array does not have enough elements"
+    if response[0] == 4:
+        return f"{action}: CALLERROR {response[2]}"
+
+    payload = response[2]
+    errors = validator.validate_response(action, payload)
+    if errors:
+        return errors[0]
+
+    check = RESPONSE_CHECKS.get(action)
+    error = check(session, request, payload) if check is not None else None
+    if error is not None:
+        return f"{action}: {error}"
+    return None
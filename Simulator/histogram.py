@@ -0,0 +1,89 @@
+import math
+
+# Log-linear buckets in the style of HdrHistogram: values below 256 us are
+# exact, above that every power of two is split into 128 sub-buckets, so any
+# recorded value is off by less than 1%.
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def bucket_index(value):
+    shift = max(0, value.bit_length() - SUB_BUCKET_BITS - 1)
+    return shift * SUB_BUCKET_COUNT + (value >> shift)
+
+
+def bucket_value(index):
+    if index < 2 * SUB_BUCKET_COUNT:
+        return index
+    shift = index // SUB_BUCKET_COUNT - 1
+    mantissa = index - shift * SUB_BUCKET_COUNT
+    return (mantissa << shift) + (1 << (shift - 1))
+
+
+class LatencyHistogram:
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, seconds):
+        value = int(seconds * 1_000_000)
+        if value < 0:
+            value = 0
+        index = bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        # Returned in microseconds, like everything else stored here.
+        if not self.count:
+            return 0
+        target = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(bucket_value(index), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_us': self.total,
+            'min_us': self.min or 0,
+            'max_us': self.max,
+            'buckets': {str(index): count for index, count in sorted(self.counts.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.counts = {int(index): count for index, count in data['buckets'].items()}
+        histogram.count = data['count']
+        histogram.total = data['total_us']
+        histogram.min = data['min_us'] if data['count'] else None
+        histogram.max = data['max_us']
+        return histogram
@@ -0,0 +1,228 @@
+import asyncio
+import argparse
+import heapq
+import random
+import time
+
+import websockets
+
+import codec
+import load
+import validator
+from calls import CALLERROR
+from fleet import raise_open_file_limit
+from histogram import LatencyHistogram
+from report import RunReport
+
+# Most production stations sit idle and only heartbeat at the interval their
+# BootNotification returned. Here one heap-ordered scheduler drives every
+# station's heartbeat; a station is a small slots object plus its socket,
+# and a task exists only while a Heartbeat waits for its answer.
+
+
+class IdleStation:
+    __slots__ = ('charge_point_id', 'ws', 'interval', 'sequence')
+
+    def __init__(self, charge_point_id, ws, interval):
+        self.charge_point_id = charge_point_id
+        self.ws = ws
+        self.interval = interval
+        self.sequence = 0
+
+
+class HeartbeatScheduler:
+    def __init__(self, report, jitter, response_timeout, seed=None):
+        self.report = report
+        self.jitter = jitter
+        self.response_timeout = response_timeout
+        self.rng = random.Random(seed)
+        self.heap = []
+        self.order = 0
+        self.wakeup = asyncio.Event()
+        self.lag = LatencyHistogram()
+        self.stations = 0
+        # Every connected station, also those out of the heap while they beat, to close them at the end.
+        self.connected = set()
+        self.beating = set()
+
+    def schedule(self, station, due):
+        self.order += 1
+        heapq.heappush(self.heap, (due, self.order, station))
+        if self.heap[0][2] is station:
+            self.wakeup.set()
+
+    def add(self, station):
+        # The first beat lands anywhere in the first interval, so stations that
+        # booted together do not heartbeat together forever after.
+        self.stations += 1
+        self.connected.add(station)
+        self.schedule(station, time.monotonic() + self.rng.uniform(0, station.interval))
+
+    def next_due(self, station, due):
+        return due + station.interval * (1 + self.rng.uniform(-self.jitter, self.jitter))
+
+    async def run(self):
+        while True:
+            now = time.monotonic()
+            while self.heap and self.heap[0][0] <= now:
+                due, _, station = heapq.heappop(self.heap)
+                self.lag.record(now - due)
+                task = asyncio.create_task(self.beat(station, due))
+                self.beating.add(task)
+                task.add_done_callback(self.beating.discard)
+
+            self.wakeup.clear()
+            timeout = self.heap[0][0] - now if self.heap else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def receive(self, station, unique_id):
+        # The reply to unique_id. The reply to an earlier beat that timed out
+        # may still be queued on the socket; it is skipped, not taken for this one.
+        counters = self.report.counters
+        while True:
+            try:
+                response = codec.loads(await station.ws.recv())
+            except codec.DecodeError:
+                counters['error: response is not valid JSON'] += 1
+                continue
+            if isinstance(response, list) and len(response) >= 3 and response[1] == unique_id:
+                return response
+            counters['unmatched_responses'] += 1
+
+    async def beat(self, station, due):
+        counters = self.report.counters
+        station.sequence += 1
+        unique_id = str(station.sequence)
+        try:
+            sent_at = time.perf_counter()
+            await station.ws.send(codec.dumps_bytes([2, unique_id, "Heartbeat", {}]), text=True)
+            counters['sent'] += 1
+            response = await asyncio.wait_for(self.receive(station, unique_id), self.response_timeout)
+        except asyncio.TimeoutError:
+            counters['call_timeouts'] += 1
+        except websockets.exceptions.ConnectionClosed:
+            counters['connection_lost'] += 1
+            self.stations -= 1
+            self.connected.discard(station)
+            return
+        else:
+            counters['received'] += 1
+            self.report.record_latency("Heartbeat", time.perf_counter() - sent_at)
+            if response[0] == CALLERROR or validator.validate_response("Heartbeat", response[2]):
+                counters['validation_failed'] += 1
+        self.schedule(station, self.next_due(station, due))
+
+
+async def connect_station(charge_point_id, scheduler, settings):
+    counters = scheduler.report.counters
+    try:
+        ws = await websockets.connect(
+            load.charge_point_url(settings.url, charge_point_id),
+            subprotocols=[settings.subprotocol],
+            open_timeout=settings.response_timeout,
+            ping_interval=None,
+            max_queue=4,
+            max_size=2 ** 16,
+        )
+    except (OSError, asyncio.TimeoutError, websockets.exceptions.InvalidHandshake):
+        counters['connect_failed'] += 1
+        return
+    counters['connected'] += 1
+
+    boot = {"chargePointVendor": "Imagine BV", "chargePointModel": "FC42"}
+    try:
+        await ws.send(codec.dumps([2, "0", "BootNotification", boot]))
+        response = codec.loads(await asyncio.wait_for(ws.recv(), settings.response_timeout))
+        interval = response[2]["interval"] if response[0] != CALLERROR else None
+    except (asyncio.TimeoutError, websockets.exceptions.ConnectionClosed, codec.DecodeError, LookupError, TypeError):
+        interval = None
+    if not interval:
+        counters['boot_failed'] += 1
+        await ws.close()
+        return
+
+    counters['booted'] += 1
+    scheduler.add(IdleStation(charge_point_id, ws, settings.interval or interval))
+
+
+async def ramp_up(station_ids, scheduler, settings):
+    started = time.monotonic()
+    semaphore = asyncio.Semaphore(settings.connect_concurrency)
+
+    async def limited(charge_point_id):
+        async with semaphore:
+            await connect_station(charge_point_id, scheduler, settings)
+
+    tasks = []
+    for number, charge_point_id in enumerate(station_ids):
+        if settings.ramp_up:
+            delay = started + number / settings.ramp_up - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(limited(charge_point_id)))
+    await asyncio.gather(*tasks)
+
+
+def print_status(scheduler, started):
+    counters = scheduler.report.counters
+    heartbeat = scheduler.report.latency.get("Heartbeat", LatencyHistogram())
+    print(f"[{time.monotonic() - started:7.0f} s] stations {scheduler.stations}, "
+          f"heartbeats {counters['sent']} (timeouts {counters['call_timeouts']}, failed {counters['validation_failed']}), "
+          f"lost {counters['connection_lost']}, "
+          f"schedule lag p99 {scheduler.lag.percentile(99) / 1000:.1f} ms, "
+          f"response p99 {heartbeat.percentile(99) / 1000:.1f} ms")
+
+
+async def run_idle_fleet(station_ids, settings):
+    report = RunReport()
+    scheduler = HeartbeatScheduler(report, settings.jitter, settings.response_timeout, settings.seed)
+    scheduler_task = asyncio.create_task(scheduler.run())
+    started = time.monotonic()
+    ramp_task = asyncio.create_task(ramp_up(station_ids, scheduler, settings))
+
+    try:
+        while time.monotonic() - started < settings.duration:
+            await asyncio.sleep(min(settings.report_interval, settings.duration - (time.monotonic() - started)))
+            print_status(scheduler, started)
+    finally:
+        ramp_task.cancel()
+        scheduler_task.cancel()
+        await asyncio.gather(ramp_task, scheduler_task, return_exceptions=True)
+        for task in list(scheduler.beating):
+            task.cancel()
+        await asyncio.gather(*scheduler.beating, return_exceptions=True)
+        await asyncio.gather(*(station.ws.close() for station in scheduler.connected), return_exceptions=True)
+
+    report.elapsed_seconds = time.monotonic() - started
+    return report, scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep many idle stations connected, heartbeating at their negotiated interval.")
+    parser.add_argument('--stations', type=int, default=10000)
+    parser.add_argument('--ramp-up', type=float, default=500, help="new connections per second (0 = all at once)")
+    parser.add_argument('--connect-concurrency', type=int, default=500, help="handshakes in progress at once")
+    parser.add_argument('--duration', type=float, default=3600, help="seconds to keep the fleet connected")
+    parser.add_argument('--interval', type=float, default=0, help="override the interval from BootNotification")
+    parser.add_argument('--jitter', type=float, default=0.05, help="random spread of each interval, as a fraction")
+    parser.add_argument('--report-interval', type=float, default=30)
+    parser.add_argument('--response-timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--id-prefix', default='CP')
+    parser.add_argument('--url', default=load.url)
+    parser.add_argument('--subprotocol', default=load.socketProtocol)
+    settings = parser.parse_args()
+
+    raise_open_file_limit()
+    station_ids = load.charge_point_ids(settings.stations, settings.id_prefix)
+    print(f"Connecting {settings.stations} idle stations to {settings.url}")
+    report, scheduler = asyncio.run(run_idle_fleet(station_ids, settings))
+    print()
+    report.print_latency()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+import asyncio
+import argparse
+import copy
+import json
+import os
+import time
+from pathlib import Path
+
+import websockets
+from dotenv import load_dotenv
+
+import authorization
+import chaos
+import codec
+import flow
+import meter_values
+import metrics
+import profiling
+import scenario
+from clock import make_clock
+from connector import split_scenario
+from authorization import Authorization
+from calls import CallTracker
+from chaos import Chaos, ChaosTracker
+from commands import StationCommands
+from report import RunReport
+from session import ChargePointSession
+
+env_path = Path('..', '.env')
+load_dotenv(dotenv_path=env_path)
+
+url = os.getenv('WEBSOCKET_URL')
+socketProtocol = os.getenv('SEC_WEB_SOCKET_PROTOCOL')
+
+
+def load_request_messages(file_path):
+    with open(file_path, 'r') as file:
+        request_messages = json.load(file)
+    try:
+        # Compiled again where it runs; this only fails before any station starts.
+        scenario.compile_scenario(request_messages)
+    except scenario.ScenarioError as e:
+        raise SystemExit(f"{file_path}: {e}")
+    return request_messages
+
+
+def charge_point_url(base_url, charge_point_id):
+    # The last path segment of WEBSOCKET_URL is the charge point identity.
+    return base_url.rsplit('/', 1)[0] + '/' + charge_point_id
+
+
+def charge_point_ids(count, prefix='CP', start=0):
+    return [f"{prefix}{number:06d}" for number in range(start, start + count)]
+
+
+# These need the idTag/transactionId from an earlier response, so every
+# CALL sent before them has to be answered first.
+DEPENDENT_ACTIONS = {"StartTransaction", "MeterValues", "StopTransaction"}
+
+
+async def complete_call(tracker, session, request, future, window, settings):
+    counters = tracker.report.counters
+    try:
+        response = await tracker.wait(request[1], future, settings.response_timeout)
+    except asyncio.TimeoutError:
+        counters['call_timeouts'] += 1
+        return
+    except websockets.exceptions.ConnectionClosed:
+        counters['calls_lost'] += 1
+        return
+    finally:
+        window.release()
+
+    started = time.perf_counter()
+    error = flow.validate_response_fields(session, request, response)
+    tracker.report.record_phase('validate', time.perf_counter() - started)
+    if error is not None:
+        counters['validation_failed'] += 1
+        counters['error: ' + error] += 1
+
+
+async def dispatch(tracker, session, request, data, window, calls, settings):
+    await window.acquire()
+    try:
+        future = await tracker.send(request[1], request[2], data)
+    except BaseException:
+        window.release()
+        raise
+    task = asyncio.create_task(complete_call(tracker, session, request, future, window, settings))
+    calls.add(task)
+    task.add_done_callback(calls.discard)
+
+
+async def stream_meter_values(tracker, session, connector, window, calls, settings):
+    # Replaces the scenario's MeterValues with a generated session of
+    # settings.meter_session hours, paced by the station's clock.
+    stream = meter_values.meter_value_stream(
+        connector.timestamp, settings.meter_session * 3600, settings.meter_sample_interval, session.clock,
+        meter_start=connector.meter_start or 0, max_power=settings.max_power, phases=settings.phases,
+        measurands=settings.measurands.split(','), battery_capacity=settings.battery_capacity or None)
+
+    for timestamp, energy, meter_value in stream:
+        payload = {"connectorId": connector.connector_id, "transactionId": connector.transaction_id,
+                   "meterValue": [meter_value]}
+        request = [2, tracker.next_unique_id(), "MeterValues", payload]
+        started = time.perf_counter()
+        data = codec.dumps_bytes(request)
+        tracker.report.record_phase('encode', time.perf_counter() - started)
+        await dispatch(tracker, session, request, data, window, calls, settings)
+        connector.timestamp = timestamp
+        connector.meter_stop = energy
+        await session.clock.sleep(settings.meter_sample_interval)
+
+
+async def run_steps(tracker, session, steps, connector_id, window, settings):
+    # connector_id replaces the scenario's connectorId; None keeps it.
+    counters = tracker.report.counters
+    calls = set()
+    streamed = False
+
+    for step in steps:
+        action = step.action
+        if action is None:
+            # A think time, or new values for the scenario's variables.
+            pause = step.run(session, connector_id)
+            if pause:
+                await session.clock.sleep(pause)
+            continue
+        if action in DEPENDENT_ACTIONS and calls:
+            await asyncio.wait(set(calls))
+
+        if action == "MeterValues" and settings.meter_session:
+            if streamed:
+                continue
+            streamed = True
+            connector = session.get(step.message[3].get("connectorId", 1) if connector_id is None else connector_id)
+            if connector.transaction_id is None:
+                counters['requests_skipped'] += 1
+                counters['error: missing transactionId for MeterValues'] += 1
+                continue
+            await stream_meter_values(tracker, session, connector, window, calls, settings)
+            continue
+
+        if tracker.skips(action):
+            continue
+
+        started = time.perf_counter()
+        error = step.error
+        if error is None:
+            values, error = flow.request_values(session, step, connector_id)
+        if error is not None:
+            counters['requests_skipped'] += 1
+            counters['error: ' + error] += 1
+            continue
+        if action == "Authorize" and session.authorization is not None \
+                and session.authorization.authorized(step.id_tag(values), session.clock.now()):
+            # Known to the station: it starts without asking the central system.
+            counters['authorize_local'] += 1
+            continue
+
+        values["uniqueId"] = tracker.next_unique_id()
+        request, data = step.request(values), step.template.render(values)
+        tracker.report.record_phase('encode', time.perf_counter() - started)
+        await dispatch(tracker, session, request, data, window, calls, settings)
+
+        if action == "MeterValues" and settings.meter_interval:
+            await session.clock.sleep(settings.meter_interval)
+
+    if calls:
+        await asyncio.wait(set(calls))
+
+
+async def run_session(tracker, session, settings):
+    # The in-flight window is per connection: with --connectors, every
+    # connector's session shares it, as OCPP allows one outstanding CALL.
+    window = asyncio.Semaphore(settings.in_flight)
+    if not settings.connectors:
+        await run_steps(tracker, session, session.steps, None, window, settings)
+        return not tracker.reader.done()
+
+    station_steps, connector_steps = split_scenario(session.steps)
+    await run_steps(tracker, session, station_steps, None, window, settings)
+    await asyncio.gather(*(
+        run_steps(tracker, session, connector_steps, connector_id, window, settings)
+        for connector_id in range(1, settings.connectors + 1)))
+    return not tracker.reader.done()
+
+
+async def run_connection(charge_point_id, steps, report, settings, deadline, clock, chaos, authorization):
+    # Returns True when the connection was lost before the station was done.
+    counters = report.counters
+    try:
+        connect_started = time.perf_counter()
+        async with websockets.connect(
+            charge_point_url(settings.url, charge_point_id),
+            subprotocols=[settings.subprotocol],
+            open_timeout=settings.response_timeout,
+            ping_interval=None,
+        ) as ws:
+            counters['connected'] += 1
+            counters['connect_seconds'] += time.perf_counter() - connect_started
+            counters['open_connections'] += 1
+            if chaos is None:
+                tracker = CallTracker(ws, report, charge_point_id)
+            else:
+                tracker = ChaosTracker(ws, report, charge_point_id, chaos)
+            commands = StationCommands(tracker, None, settings.response_timeout)
+            tracker.handlers.update(commands.handlers())
+            if authorization is not None:
+                tracker.handlers.update(authorization.handlers())
+            tracker.start()
+            try:
+                while True:
+                    session = commands.session = ChargePointSession(charge_point_id, steps, clock,
+                                                                    report.transactions, authorization)
+                    if not await run_session(tracker, session, settings):
+                        counters['connection_lost'] += 1
+                        return True
+                    counters['sessions_completed'] += 1
+                    if not settings.loop or time.monotonic() >= deadline:
+                        break
+                if settings.hold:
+                    # Stay connected for commands from the central system, e.g. a mass RemoteStart.
+                    await asyncio.wait([tracker.reader], timeout=max(0, min(settings.hold, deadline - time.monotonic())))
+                    if tracker.reader.done():
+                        counters['connection_lost'] += 1
+                        return True
+                return False
+            finally:
+                counters['open_connections'] -= 1
+                await commands.stop()
+                await tracker.stop()
+    except (OSError, asyncio.TimeoutError, websockets.exceptions.InvalidHandshake):
+        counters['connect_failed'] += 1
+    except websockets.exceptions.ConnectionClosed:
+        counters['connection_lost'] += 1
+        return True
+    return False
+
+
+async def run_charge_point(charge_point_id, steps, report, settings, deadline, chaos=None):
+    counters = report.counters
+    counters['stations_started'] += 1
+    clock = make_clock(settings.clock_speed)
+    authorization = Authorization(settings.auth_cache, settings.auth_hit_ratio) if settings.auth_cache else None
+    try:
+        while await run_connection(charge_point_id, steps, report, settings, deadline, clock, chaos, authorization):
+            # Under chaos, stations whose connection dropped reconnect like real ones.
+            if chaos is None or not settings.loop or time.monotonic() >= deadline:
+                break
+            counters['reconnects'] += 1
+    except asyncio.CancelledError:
+        counters['stations_cancelled'] += 1
+        raise
+
+
+async def run_load(request_messages, station_ids, settings):
+    report = RunReport()
+    steps = scenario.compile_scenario(request_messages)
+    if steps.connectors and not settings.connectors:
+        settings = copy.copy(settings)
+        settings.connectors = steps.connectors
+    chaos = Chaos.from_settings(settings)
+    semaphore = asyncio.Semaphore(settings.concurrency)
+    tasks = set()
+
+    async def limited(charge_point_id):
+        try:
+            await run_charge_point(charge_point_id, steps, report, settings, deadline, chaos)
+        finally:
+            semaphore.release()
+
+    stop_exporters = await metrics.start_exporters(report, settings)
+    started = time.monotonic()
+    deadline = started + settings.duration if settings.duration else float('inf')
+
+    async def ramp_up():
+        for number, charge_point_id in enumerate(station_ids):
+            if settings.ramp_up:
+                delay = started + number / settings.ramp_up - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await semaphore.acquire()
+            if time.monotonic() >= deadline:
+                semaphore.release()
+                break
+            task = asyncio.create_task(limited(charge_point_id))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        while tasks:
+            await asyncio.wait(set(tasks))
+
+    try:
+        await asyncio.wait_for(ramp_up(), deadline - started if settings.duration else None)
+    except asyncio.TimeoutError:
+        pass
+    for task in list(tasks):
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    report.elapsed_seconds = time.monotonic() - started
+    await stop_exporters()
+    return report
+
+
+def print_results(report):
+    results = report.counters
+    elapsed = report.elapsed_seconds or 1
+    print(f"Stations started:   {results['stations_started']}")
+    print(f"Connected:          {results['connected']} (failed {results['connect_failed']}, lost {results['connection_lost']}, "
+          f"reconnects {results['reconnects']})")
+    if results['connected']:
+        print(f"Avg connect time:   {results['connect_seconds'] / results['connected'] * 1000:.1f} ms")
+    print(f"Sessions completed: {results['sessions_completed']}")
+    print(f"Messages sent:      {results['sent']} ({results['sent'] / elapsed:.1f}/s)")
+    print(f"Responses received: {results['received']} (timeouts {results['call_timeouts']}, "
+          f"unmatched {results['unmatched_responses']}, reordered {results['reordered_responses']})")
+    if results['authorize_local']:
+        local = results['authorize_local']
+        print(f"Authorize:          {report.sent['Authorize']} sent, {local} answered locally "
+              f"({local / (local + report.sent['Authorize']) * 100:.1f}% hits)")
+    if results['server_calls']:
+        print(f"Server CALLs:       {results['server_calls']} (unsupported {results['server_calls_unsupported']}, "
+              f"invalid {results['server_calls_invalid']}, failed {results['server_calls_failed']})")
+    print(f"Validation failed:  {results['validation_failed']}")
+    print(f"Elapsed:            {report.elapsed_seconds:.1f} s")
+    if report.transactions.started:
+        report.transactions.print_summary()
+    for key, count in sorted(results.items()):
+        if key.startswith('error: '):
+            print(f"  {count:8d}  {key[7:]}")
+    print()
+    report.print_latency()
+    if report.phases:
+        print()
+        report.print_phases()
+    if report.server_calls:
+        print()
+        report.print_server_calls()
+
+
+def write_reports(report, settings):
+    if settings.report_json:
+        report.write_json(settings.report_json)
+        print(f"Report written to {settings.report_json}")
+    if settings.report_csv:
+        report.write_csv(settings.report_csv)
+        print(f"Report written to {settings.report_csv}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Replay a scenario from many simulated charge points at once.")
+    parser.add_argument('request_file', help="scenario file, e.g. ../All/valid.json")
+    parser.add_argument('--stations', type=int, default=100, help="number of simulated charge points")
+    parser.add_argument('--ramp-up', type=float, default=50, help="new stations per second (0 = all at once)")
+    parser.add_argument('--concurrency', type=int, default=1000, help="maximum number of open connections")
+    parser.add_argument('--duration', type=float, default=0, help="stop the run after this many seconds (0 = no limit)")
+    parser.add_argument('--loop', action='store_true', help="replay the scenario until --duration is reached")
+    parser.add_argument('--meter-interval', type=float, default=60, help="pause after each MeterValues, in seconds")
+    parser.add_argument('--clock-speed', help="run each station on a virtual clock: a speed-up factor, or 'max' to skip every pause")
+    parser.add_argument('--meter-session', type=float, default=0,
+                        help="replace the scenario's MeterValues with a generated session of this many hours")
+    parser.add_argument('--meter-sample-interval', type=float, default=60, help="seconds between generated samples")
+    parser.add_argument('--measurands', default='Energy.Active.Import.Register',
+                        help="comma separated: Energy.Active.Import.Register, Power.Active.Import, Current.Import, Voltage, SoC")
+    parser.add_argument('--phases', type=int, default=3, choices=[1, 2, 3])
+    parser.add_argument('--max-power', type=float, default=11000, help="charging power in W")
+    parser.add_argument('--battery-capacity', type=float, default=0, help="battery size in Wh, needed for SoC")
+    parser.add_argument('--connectors', type=int, default=0,
+                        help="run the scenario's charging session on connectors 1..N at once (0 = as written)")
+    parser.add_argument('--in-flight', type=int, default=1, help="CALLs kept outstanding per connection (1 = lock-step)")
+    parser.add_argument('--hold', type=float, default=0,
+                        help="keep each connection open this many seconds after its scenario, answering server CALLs")
+    parser.add_argument('--response-timeout', type=float, default=30, help="per-call timeout, in seconds")
+    parser.add_argument('--id-prefix', default='CP')
+    parser.add_argument('--report-json', help="write counters and latency percentiles to this JSON file")
+    parser.add_argument('--report-csv', help="write per-action latency percentiles to this CSV file")
+    parser.add_argument('--url', default=url)
+    parser.add_argument('--subprotocol', default=socketProtocol)
+    metrics.add_arguments(parser)
+    chaos.add_arguments(parser)
+    authorization.add_arguments(parser)
+    profiling.add_arguments(parser)
+    return parser
+
+
+def main():
+    settings = build_parser().parse_args()
+    request_messages = load_request_messages(settings.request_file)
+    station_ids = charge_point_ids(settings.stations, settings.id_prefix)
+
+    print(f"Starting {settings.stations} charge points against {settings.url}")
+    with profiling.profiled(settings.profile, settings.profile_output, settings.profile_interval / 1000):
+        report = asyncio.run(run_load(request_messages, station_ids, settings))
+    print_results(report)
+    write_reports(report, settings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import logging
+import os
+import sys
+import time
+
+# Leveled logging for the scripts that used to print every frame. LOG_LEVEL
+# (DEBUG, INFO, WARNING, ...) picks what is shown; LOG_RATE caps how many
+# lines per second each level may write, so a soak run at thousands of
+# messages per second is not slowed down by its own output.
+
+
+class RateLimitFilter(logging.Filter):
+    # A token bucket per level. Dropped records are counted and reported on
+    # the next line of that level that gets through.
+    def __init__(self, per_second):
+        super().__init__()
+        self.per_second = per_second
+        self.buckets = {}
+
+    def filter(self, record):
+        now = time.monotonic()
+        tokens, updated, suppressed = self.buckets.get(record.levelno, (self.per_second, now, 0))
+        tokens = min(self.per_second, tokens + (now - updated) * self.per_second)
+        if tokens < 1:
+            self.buckets[record.levelno] = (tokens, now, suppressed + 1)
+            return False
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar lines suppressed)"
+            record.args = ()
+        self.buckets[record.levelno] = (tokens - 1, now, 0)
+        return True
+
+
+def get_logger(name, level=None, rate=None):
+    # Plain messages on stdout, like the print() calls they replace.
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    rate = float(rate if rate is not None else os.getenv('LOG_RATE') or 0)
+    if rate > 0:
+        handler.addFilter(RateLimitFilter(rate))
+    logger.addHandler(handler)
+    logger.setLevel((level or os.getenv('LOG_LEVEL') or 'INFO').upper())
+    logger.propagate = False
+    return logger
@@ -0,0 +1,79 @@
+import random
+
+# Lazily generated MeterValues for one charging session. Nothing is
+# precomputed, so a 10 hour session at 10 s sampling costs one sample of
+# memory at a time.
+
+PHASES = ("L1", "L2", "L3")
+
+MEASURAND_UNITS = {
+    "Energy.Active.Import.Register": "Wh",
+    "Power.Active.Import": "W",
+    "Current.Import": "A",
+    "Voltage": "V",
+    "SoC": "Percent",
+}
+
+DEFAULT_MEASURANDS = ("Energy.Active.Import.Register",)
+
+
+def charging_power(max_power, soc):
+    # Constant power up to 80% state of charge, then a linear taper to 10% of
+    # max_power at 100%, roughly what a CC/CV charge curve looks like.
+    if soc is None or soc < 80:
+        return max_power
+    return max_power * (1 - 0.9 * (soc - 80) / 20)
+
+
+def sampled_value(value, measurand, phase=None):
+    sample = {
+        "value": value,
+        "context": "Sample.Periodic",
+        "measurand": measurand,
+        "location": "Outlet",
+        "unit": MEASURAND_UNITS[measurand],
+    }
+    if phase is not None:
+        sample["phase"] = phase
+    return sample
+
+
+def meter_value_stream(start, duration, interval, clock, meter_start=0, max_power=11000,
+                       phases=3, voltage=230, measurands=DEFAULT_MEASURANDS,
+                       battery_capacity=None, soc_start=20, seed=None):
+    # Yields (epoch, energy_register_wh, meterValue entry) every `interval`
+    # seconds of session time from `start` until `duration` has passed.
+    # The energy register only ever increases.
+    rng = random.Random(seed)
+    phase_names = PHASES[:phases]
+    energy = float(meter_start)
+    soc = float(soc_start) if battery_capacity else None
+    samples = int(duration // interval)
+
+    for number in range(1, samples + 1):
+        power = charging_power(max_power, soc) * rng.uniform(0.97, 1.0)
+        if soc is not None and soc >= 100:
+            power = 0.0
+        added = power * interval / 3600
+        energy += added
+        if soc is not None:
+            soc = min(100.0, soc + added / battery_capacity * 100)
+
+        values = []
+        for measurand in measurands:
+            if measurand == "Energy.Active.Import.Register":
+                values.append(sampled_value(str(int(energy)), measurand))
+            elif measurand == "Power.Active.Import":
+                values.append(sampled_value(f"{power:.0f}", measurand))
+            elif measurand == "Current.Import":
+                current = power / (len(phase_names) * voltage)
+                for phase in phase_names:
+                    values.append(sampled_value(f"{current:.1f}", measurand, phase))
+            elif measurand == "Voltage":
+                for phase in phase_names:
+                    values.append(sampled_value(f"{voltage * rng.uniform(0.98, 1.02):.1f}", measurand, f"{phase}-N"))
+            elif measurand == "SoC" and soc is not None:
+                values.append(sampled_value(f"{soc:.0f}", measurand))
+
+        timestamp = start + number * interval
+        yield timestamp, int(energy), {"timestamp": clock.format(timestamp), "sampledValue": values}
@@ -0,0 +1,205 @@
+import asyncio
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from histogram import LatencyHistogram
+
+# Live metrics of a running RunReport, in Prometheus text format on a local
+# HTTP endpoint or pushed to a StatsD daemon over UDP. Nothing is computed per
+# message: the hot path only bumps the report's counters, and the exporters
+# read them when scraped or on their push interval.
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+# RunReport counter -> (metric, type, help).
+COUNTER_METRICS = {
+    'connected': ('ocpp_connects_total', 'counter', "Connections opened."),
+    'connect_failed': ('ocpp_connect_failures_total', 'counter', "Connections that could not be opened."),
+    'connection_lost': ('ocpp_connections_lost_total', 'counter', "Connections closed by the other side."),
+    'reconnects': ('ocpp_reconnects_total', 'counter', "Connections reopened after they dropped."),
+    'call_timeouts': ('ocpp_call_timeouts_total', 'counter', "CALLs that were not answered in time."),
+    'unmatched_responses': ('ocpp_unmatched_responses_total', 'counter', "Responses to no outstanding CALL."),
+    'sessions_completed': ('ocpp_sessions_completed_total', 'counter', "Scenario runs completed."),
+    'open_connections': ('ocpp_open_connections', 'gauge', "Connections open right now."),
+    'in_flight': ('ocpp_in_flight_calls', 'gauge', "CALLs sent and not answered yet."),
+}
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def snapshot(histogram):
+    # A copy that is safe to read while another thread records into the original.
+    copy = LatencyHistogram()
+    copy.counts = dict(histogram.counts)
+    copy.count = sum(copy.counts.values())
+    copy.total = histogram.total
+    copy.min = histogram.min
+    copy.max = histogram.max
+    return copy
+
+
+def render_prometheus(report):
+    counters = dict(report.counters)
+    lines = []
+    for key, (metric, kind, description) in COUNTER_METRICS.items():
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.append(f"{metric} {counters.get(key, 0)}")
+
+    lines.append("# HELP ocpp_sent_total CALLs sent, per action.")
+    lines.append("# TYPE ocpp_sent_total counter")
+    for action, count in sorted(dict(report.sent).items()):
+        lines.append(f'ocpp_sent_total{{action="{escape_label(action)}"}} {count}')
+
+    latency = {action: snapshot(histogram) for action, histogram in dict(report.latency).items()}
+    lines.append("# HELP ocpp_received_total Responses received, per action.")
+    lines.append("# TYPE ocpp_received_total counter")
+    for action, histogram in sorted(latency.items()):
+        lines.append(f'ocpp_received_total{{action="{escape_label(action)}"}} {histogram.count}')
+
+    lines.append("# HELP ocpp_validation_failures_total Responses that failed validation, per reason.")
+    lines.append("# TYPE ocpp_validation_failures_total counter")
+    for key, count in sorted(counters.items()):
+        if key.startswith('error: '):
+            lines.append(f'ocpp_validation_failures_total{{reason="{escape_label(key[7:])}"}} {count}')
+
+    lines.append("# HELP ocpp_response_seconds Time from sending a CALL to its response, per action.")
+    lines.append("# TYPE ocpp_response_seconds summary")
+    for action, histogram in sorted(latency.items()):
+        label = escape_label(action)
+        for quantile in QUANTILES:
+            value = histogram.percentile(quantile * 100) / 1_000_000
+            lines.append(f'ocpp_response_seconds{{action="{label}",quantile="{quantile:g}"}} {value:.6f}')
+        lines.append(f'ocpp_response_seconds_sum{{action="{label}"}} {histogram.total / 1_000_000:.6f}')
+        lines.append(f'ocpp_response_seconds_count{{action="{label}"}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+async def serve_prometheus(report, host, port):
+    # A minimal HTTP endpoint on the load generator's own event loop; every
+    # request, whatever its path, gets the current metrics.
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            body = render_prometheus(report).encode()
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: ' + PROMETHEUS_CONTENT_TYPE.encode()
+                         + f'\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+def serve_prometheus_in_thread(report, host, port):
+    # For the websocket-client scripts, which have no event loop of their own.
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render_prometheus(report).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class StatsdPusher:
+    # Pushes counter increments, gauges and latency percentiles every interval.
+    def __init__(self, report, address, interval=10, prefix='ocpp'):
+        host, _, port = address.rpartition(':')
+        self.report = report
+        self.address = (host or 'localhost', int(port))
+        self.interval = interval
+        self.prefix = prefix
+        self.previous = {}
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def lines(self):
+        counters = dict(self.report.counters)
+        values = {}
+        for key, (_, kind, _) in COUNTER_METRICS.items():
+            values[(key, kind)] = counters.get(key, 0)
+        for action, count in dict(self.report.sent).items():
+            values[(f"sent.{action}", 'counter')] = count
+        for action, histogram in dict(self.report.latency).items():
+            histogram = snapshot(histogram)
+            values[(f"received.{action}", 'counter')] = histogram.count
+            for quantile in QUANTILES:
+                percent = f"{quantile * 100:g}".replace('.', '_')
+                values[(f"response_ms.{action}.p{percent}", 'gauge')] = round(histogram.percentile(quantile * 100) / 1000, 3)
+        values[("validation_failures", 'counter')] = counters.get('validation_failed', 0)
+
+        for (name, kind), value in values.items():
+            if kind == 'counter':
+                delta = value - self.previous.get(name, 0)
+                self.previous[name] = value
+                if delta:
+                    yield f"{self.prefix}.{name}:{delta}|c"
+            else:
+                yield f"{self.prefix}.{name}:{value}|g"
+
+    def push(self):
+        packet = []
+        size = 0
+        for line in self.lines():
+            if packet and size + len(line) + 1 > 1400:
+                self.send('\n'.join(packet))
+                packet, size = [], 0
+            packet.append(line)
+            size += len(line) + 1
+        if packet:
+            self.send('\n'.join(packet))
+
+    def send(self, data):
+        try:
+            self.socket.sendto(data.encode(), self.address)
+        except (BlockingIOError, OSError):
+            self.report.counters['statsd_dropped'] += 1
+
+    async def run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                self.push()
+        finally:
+            self.push()
+
+
+async def start_exporters(report, settings):
+    # Starts whatever --metrics-port / --statsd ask for. Returns a callable
+    # that stops them again.
+    server = task = None
+    if settings.metrics_port:
+        server = await serve_prometheus(report, settings.metrics_host, settings.metrics_port)
+    if settings.statsd:
+        task = asyncio.create_task(StatsdPusher(report, settings.statsd, settings.statsd_interval).run())
+
+    async def stop():
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    return stop
+
+
+def add_arguments(parser):
+    parser.add_argument('--metrics-port', type=int, help="serve live metrics in Prometheus format on this port")
+    parser.add_argument('--metrics-host', default='127.0.0.1')
+    parser.add_argument('--statsd', metavar='HOST:PORT', help="push live metrics to this StatsD address")
+    parser.add_argument('--statsd-interval', type=float, default=10, help="seconds between StatsD pushes")
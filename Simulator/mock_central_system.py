@@ -0,0 +1,321 @@
+import asyncio
+import argparse
+import itertools
+import os
+import random
+import signal
+import time
+from collections import Counter
+from pathlib import Path
+from urllib.parse import urlparse
+
+import websockets
+from dotenv import load_dotenv
+
+import codec
+import validator
+from calls import CALL, CALLRESULT, CALLERROR
+from clock import WALL_CLOCK
+from histogram import LatencyHistogram
+
+env_path = Path('..', '.env')
+load_dotenv(dotenv_path=env_path)
+
+url = os.getenv('WEBSOCKET_URL')
+socketProtocol = os.getenv('SEC_WEB_SOCKET_PROTOCOL')
+
+transaction_ids = itertools.count(1)
+accepted = {"status": "Accepted"}
+
+
+def boot_notification(payload):
+    return {"status": "Accepted", "currentTime": WALL_CLOCK.timestamp(), "interval": 900}
+
+
+def authorize(payload):
+    # Any idTag is known here, except an empty one, which no card can carry.
+    if not payload.get("idTag"):
+        return {"idTagInfo": {"status": "Invalid"}}
+    return {"idTagInfo": accepted}
+
+
+def heartbeat(payload):
+    return {"currentTime": WALL_CLOCK.timestamp()}
+
+
+def start_transaction(payload):
+    return {"idTagInfo": accepted, "transactionId": next(transaction_ids)}
+
+
+def stop_transaction(payload):
+    return {"idTagInfo": accepted}
+
+
+def meter_values(payload):
+    # MeterValues.conf is empty in OCPP 1.6, but the flow in All/test.py
+    # expects our central system's "Status" field.
+    return {"Status": "Accepted"}
+
+
+def empty(payload):
+    return {}
+
+
+def data_transfer(payload):
+    return {"status": "Accepted"}
+
+
+HANDLERS = {
+    "BootNotification": boot_notification,
+    "Authorize": authorize,
+    "Heartbeat": heartbeat,
+    "StartTransaction": start_transaction,
+    "StopTransaction": stop_transaction,
+    "MeterValues": meter_values,
+    "StatusNotification": empty,
+    "DiagnosticsStatusNotification": empty,
+    "FirmwareStatusNotification": empty,
+    "DataTransfer": data_transfer,
+}
+
+
+# Commands the mock can send to every connected station at once, as
+# action -> payload(open transactionIds of the connection); None skips the station.
+FAN_OUT_PAYLOADS = {
+    "RemoteStartTransaction": lambda transactions: {"connectorId": 1, "idTag": "TK_001"},
+    "RemoteStopTransaction": lambda transactions: {"transactionId": min(transactions)} if transactions else None,
+    "ChangeConfiguration": lambda transactions: {"key": "HeartbeatInterval", "value": "300"},
+    "GetConfiguration": lambda transactions: {},
+    "TriggerMessage": lambda transactions: {"requestedMessage": "StatusNotification", "connectorId": 1},
+}
+
+
+def parse_fan_out(values):
+    # ["RemoteStartTransaction@30"] -> [("RemoteStartTransaction", 30.0)]
+    fan_outs = []
+    for value in values:
+        action, _, seconds = value.partition('@')
+        if action not in FAN_OUT_PAYLOADS:
+            raise SystemExit(f"--fan-out: {action} is not one of {', '.join(FAN_OUT_PAYLOADS)}")
+        fan_outs.append((action, float(seconds or 0)))
+    return fan_outs
+
+
+def parse_per_action(values, convert):
+    # ["BootNotification=50", "*=5"] -> {"BootNotification": 50, "*": 5}
+    per_action = {}
+    for value in values:
+        action, _, number = value.partition('=')
+        per_action[action] = convert(number)
+    return per_action
+
+
+class MockCentralSystem:
+    def __init__(self, latency, error_rate, validate, seed=None, auth_expiry=0, local_list=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.validate = validate
+        self.rng = random.Random(seed)
+        self.counters = Counter()
+        # idTagInfo.expiryDate this many seconds ahead (0 = none).
+        self.auth_expiry = auth_expiry
+        # idTags sent to every station in a SendLocalList after its boot.
+        self.local_list = local_list
+        self.server_call_ids = itertools.count(1)
+        # Open connections -> the transactionIds open on them.
+        self.connections = {}
+        # uniqueId -> future of CALLs we sent to a station.
+        self.server_calls = {}
+
+    def answer(self, frame):
+        # Returns the response frame for a CALL.
+        unique_id, action, payload = frame[1], frame[2], frame[3]
+        handler = HANDLERS.get(action)
+        if handler is None:
+            return [CALLERROR, unique_id, "NotImplemented", f"Unknown action {action}", {}]
+        if self.validate:
+            errors = validator.validate_request(action, payload)
+            if errors:
+                self.counters['invalid: ' + action] += 1
+                return [CALLERROR, unique_id, "FormationViolation", errors[0], {}]
+        error_rate = self.error_rate.get(action, self.error_rate.get('*', 0))
+        if error_rate and self.rng.random() < error_rate:
+            self.counters['injected errors'] += 1
+            return [CALLERROR, unique_id, "InternalError", "Injected error", {}]
+        response = handler(payload)
+        if self.auth_expiry and "idTagInfo" in response:
+            expiry = WALL_CLOCK.format(WALL_CLOCK.now() + self.auth_expiry)
+            response = dict(response, idTagInfo=dict(response["idTagInfo"], expiryDate=expiry))
+        return [CALLRESULT, unique_id, response]
+
+    async def call(self, ws, action, payload, timeout=30):
+        # Sends a CALL to a station. Returns its response frame, or None.
+        unique_id = str(next(self.server_call_ids))
+        future = self.server_calls[unique_id] = asyncio.get_running_loop().create_future()
+        try:
+            await ws.send(codec.dumps([CALL, unique_id, action, payload]))
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, websockets.exceptions.ConnectionClosed):
+            self.counters['server calls unanswered'] += 1
+            return None
+        finally:
+            self.server_calls.pop(unique_id, None)
+
+    async def send_local_list(self, ws):
+        entries = [{"idTag": f"LOCAL{number:06d}", "idTagInfo": accepted} for number in range(self.local_list)]
+        await self.call(ws, "SendLocalList", {"listVersion": 1, "updateType": "Full", "localAuthorizationList": entries})
+        await self.call(ws, "GetLocalListVersion", {})
+
+    async def fan_out(self, action, delay):
+        # Sends action to every connected station at once and reports how
+        # long until each of them had answered.
+        await asyncio.sleep(delay)
+        targets = []
+        for ws, transactions in list(self.connections.items()):
+            payload = FAN_OUT_PAYLOADS[action](transactions)
+            if payload is not None:
+                targets.append((ws, payload))
+        answered = LatencyHistogram()
+        statuses = Counter()
+        started = time.perf_counter()
+
+        async def one(ws, payload):
+            response = await self.call(ws, action, payload)
+            if response is None:
+                statuses['no answer'] += 1
+                return
+            answered.record(time.perf_counter() - started)
+            statuses[response[2].get("status", "answered") if response[0] == CALLRESULT else response[2]] += 1
+
+        await asyncio.gather(*(one(ws, payload) for ws, payload in targets))
+        print(f"Fan-out {action} to {len(targets)} stations: all answered after "
+              f"{(time.perf_counter() - started) * 1000:.1f} ms (p50 {answered.percentile(50) / 1000:.1f} ms, "
+              f"p99 {answered.percentile(99) / 1000:.1f} ms) "
+              + ", ".join(f"{status} {count}" for status, count in statuses.most_common()))
+
+    def respond(self, frame, transactions):
+        # answer(), keeping track of the transactions open on the connection.
+        response = self.answer(frame)
+        if frame[2] == "StartTransaction" and response[0] == CALLRESULT:
+            transactions.add(response[2]["transactionId"])
+        return codec.dumps(response)
+
+    async def reply(self, ws, frame, delay, transactions):
+        await asyncio.sleep(delay)
+        try:
+            await ws.send(self.respond(frame, transactions))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def handle(self, ws):
+        self.counters['connections'] += 1
+        self.counters['open connections'] += 1
+        transactions = self.connections[ws] = set()
+        pending = set()
+        try:
+            async for message in ws:
+                try:
+                    frame = codec.loads(message)
+                except codec.DecodeError:
+                    self.counters['malformed frames'] += 1
+                    continue
+                if isinstance(frame, list) and len(frame) >= 3 and frame[0] in (CALLRESULT, CALLERROR) \
+                        and isinstance(frame[1], str):
+                    # A station answering one of our CALLs.
+                    self.counters['server call results' if frame[0] == CALLRESULT else 'server call errors'] += 1
+                    future = self.server_calls.get(frame[1])
+                    if future is not None and not future.done():
+                        future.set_result(frame)
+                    continue
+                if not isinstance(frame, list) or len(frame) < 4 or frame[0] != CALL or not isinstance(frame[1], str):
+                    self.counters['malformed frames'] += 1
+                    continue
+                if not isinstance(frame[2], str) or not isinstance(frame[3], dict):
+                    # A CALL we can answer, but not look up by action.
+                    self.counters['malformed frames'] += 1
+                    await ws.send(codec.dumps([CALLERROR, frame[1], "FormationViolation",
+                                               "action must be a string and the payload an object", {}]))
+                    continue
+                self.counters[frame[2]] += 1
+
+                latency = self.latency.get(frame[2], self.latency.get('*', 0))
+                if latency:
+                    # Answer from a task so slow actions do not hold up the rest.
+                    delay = self.rng.uniform(0.5, 1.5) * latency / 1000
+                    task = asyncio.create_task(self.reply(ws, frame, delay, transactions))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                else:
+                    await ws.send(self.respond(frame, transactions))
+                if frame[2] == "StopTransaction":
+                    transactions.discard(frame[3].get("transactionId"))
+                if frame[2] == "BootNotification" and self.local_list:
+                    task = asyncio.create_task(self.send_local_list(ws))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self.counters['open connections'] -= 1
+            del self.connections[ws]
+            for task in pending:
+                task.cancel()
+
+    def print_counters(self):
+        for key, count in sorted(self.counters.items()):
+            print(f"  {count:10d}  {key}")
+
+
+async def serve(central_system, host, port, subprotocol, report_interval, fan_outs=()):
+    stop = asyncio.get_running_loop().create_future()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signum, stop.set_result, None)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    async with websockets.serve(central_system.handle, host, port, subprotocols=[subprotocol],
+                                ping_interval=None, max_queue=None):
+        print(f"Mock central system listening on ws://{host}:{port}/<chargePointId> ({subprotocol})")
+        fan_out_tasks = [asyncio.create_task(central_system.fan_out(action, delay)) for action, delay in fan_outs]
+        while not stop.done():
+            await asyncio.wait([stop], timeout=report_interval or None)
+            if report_interval and not stop.done():
+                central_system.print_counters()
+    for task in fan_out_tasks:
+        task.cancel()
+    print("Stopped.")
+    central_system.print_counters()
+
+
+def main():
+    default = urlparse(url or 'ws://localhost:5028/OCPP1')
+    parser = argparse.ArgumentParser(description="Answer OCPP 1.6 CALLs the way our central system does, for offline load tests.")
+    parser.add_argument('--host', default=default.hostname)
+    parser.add_argument('--port', type=int, default=default.port or 80)
+    parser.add_argument('--subprotocol', default=socketProtocol or 'ocpp1.6')
+    parser.add_argument('--latency', action='append', default=[], metavar='ACTION=MS',
+                        help="mean response delay per action, '*' for all (repeatable)")
+    parser.add_argument('--error-rate', action='append', default=[], metavar='ACTION=FRACTION',
+                        help="share of CALLs answered with an InternalError CALLERROR, '*' for all (repeatable)")
+    parser.add_argument('--no-validate', action='store_true', help="do not reject requests that break the schema")
+    parser.add_argument('--auth-expiry', type=float, default=0,
+                        help="give every idTagInfo an expiryDate this many seconds ahead (0 = none)")
+    parser.add_argument('--local-list', type=int, default=0, metavar='TAGS',
+                        help="send every station a SendLocalList with this many idTags after it boots")
+    parser.add_argument('--fan-out', action='append', default=[], metavar='ACTION@SECONDS',
+                        help=f"send ACTION to every connected station SECONDS after start (repeatable): "
+                             f"{', '.join(FAN_OUT_PAYLOADS)}")
+    parser.add_argument('--report-interval', type=float, default=0, help="print counters every N seconds")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    central_system = MockCentralSystem(
+        parse_per_action(args.latency, float), parse_per_action(args.error_rate, float),
+        not args.no_validate, args.seed, args.auth_expiry, args.local_list)
+    asyncio.run(serve(central_system, args.host, args.port, args.subprotocol, args.report_interval,
+                      parse_fan_out(args.fan_out)))
+
+
+if __name__ == "__main__":
+    main()
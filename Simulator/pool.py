@@ -0,0 +1,147 @@
+import asyncio
+import contextlib
+import time
+
+import websockets
+
+import load
+from calls import CallTracker, CALLERROR
+from histogram import LatencyHistogram
+
+# Open connections kept for reuse, one per (charge point identity,
+# subprotocol): a central system drops the older of two connections with the
+# same identity, so a key is only ever lent to one user at a time. Connects
+# and boots are timed separately from the CALLs sent over the connection.
+
+BOOT_NOTIFICATION = {"chargePointVendor": "Imagine BV", "chargePointModel": "FC42"}
+
+
+class PooledConnection:
+    __slots__ = ('key', 'ws', 'tracker', 'booted', 'last_used')
+
+    def __init__(self, key, ws, tracker):
+        self.key = key
+        self.ws = ws
+        self.tracker = tracker
+        self.booted = False
+        self.last_used = time.monotonic()
+
+    def is_open(self):
+        return not self.tracker.reader.done()
+
+
+class ConnectionPool:
+    def __init__(self, url, report, timeout=30, boot=False, check_after=60, connect_attempts=3):
+        self.url = url
+        self.report = report
+        self.timeout = timeout
+        self.boot = boot
+        # Connections idle for longer than this get a Heartbeat before reuse.
+        self.check_after = check_after
+        self.connect_attempts = connect_attempts
+        self.connections = {}
+        self.locks = {}
+        self.connect_latency = LatencyHistogram()
+        self.boot_latency = LatencyHistogram()
+
+    async def open(self, key):
+        counters = self.report.counters
+        charge_point_id, subprotocol = key
+        for attempt in range(self.connect_attempts):
+            if attempt:
+                await asyncio.sleep(min(2 ** attempt * 0.1, 5))
+            started = time.perf_counter()
+            try:
+                ws = await websockets.connect(
+                    load.charge_point_url(self.url, charge_point_id),
+                    subprotocols=[subprotocol],
+                    open_timeout=self.timeout,
+                    ping_interval=None,
+                )
+            except (OSError, asyncio.TimeoutError, websockets.exceptions.InvalidHandshake):
+                counters['pool_connect_failed'] += 1
+                continue
+            self.connect_latency.record(time.perf_counter() - started)
+            counters['pool_connects'] += 1
+            tracker = CallTracker(ws, self.report, charge_point_id)
+            tracker.start()
+            connection = PooledConnection(key, ws, tracker)
+            if not self.boot or await self.boot_connection(connection):
+                return connection
+            await self.discard(connection)
+        raise ConnectionError(f"cannot open a connection for {charge_point_id}")
+
+    async def boot_connection(self, connection):
+        started = time.perf_counter()
+        response = await connection.tracker.call("BootNotification", BOOT_NOTIFICATION, self.timeout)
+        if response is None or response[0] == CALLERROR or not isinstance(response[2], dict) \
+                or response[2].get("status") != "Accepted":
+            self.report.counters['pool_boot_failed'] += 1
+            return False
+        self.boot_latency.record(time.perf_counter() - started)
+        connection.booted = True
+        return True
+
+    async def healthy(self, connection):
+        if not connection.is_open():
+            return False
+        if time.monotonic() - connection.last_used < self.check_after:
+            return True
+        self.report.counters['pool_health_checks'] += 1
+        try:
+            response = await connection.tracker.call("Heartbeat", {}, self.timeout)
+        except websockets.exceptions.ConnectionClosed:
+            return False
+        return response is not None and response[0] != CALLERROR
+
+    async def discard(self, connection):
+        await connection.tracker.stop()
+        await connection.ws.close()
+
+    @contextlib.asynccontextmanager
+    async def connection(self, charge_point_id, subprotocol):
+        # Lends the connection for this identity, opening or reopening it as
+        # needed. Yields its CallTracker.
+        key = (charge_point_id, subprotocol)
+        lock = self.locks.get(key)
+        if lock is None:
+            lock = self.locks[key] = asyncio.Lock()
+        async with lock:
+            connection = self.connections.get(key)
+            if connection is not None and not await self.healthy(connection):
+                self.report.counters['reconnects'] += 1
+                del self.connections[key]
+                await self.discard(connection)
+                connection = None
+            if connection is None:
+                connection = self.connections[key] = await self.open(key)
+            else:
+                self.report.counters['pool_reused'] += 1
+            try:
+                yield connection.tracker
+            finally:
+                connection.last_used = time.monotonic()
+
+    async def warm(self, charge_point_ids, subprotocol):
+        # Opens (and boots) connections up front, so the first user does not pay for it.
+        async def open_one(charge_point_id):
+            async with self.connection(charge_point_id, subprotocol):
+                pass
+        await asyncio.gather(*(open_one(charge_point_id) for charge_point_id in charge_point_ids),
+                             return_exceptions=True)
+
+    async def close(self):
+        connections = list(self.connections.values())
+        self.connections.clear()
+        await asyncio.gather(*(self.discard(connection) for connection in connections), return_exceptions=True)
+
+    def print_connects(self):
+        counters = self.report.counters
+        print(f"Connects:           {counters['pool_connects']} (failed {counters['pool_connect_failed']}, "
+              f"reconnects {counters['reconnects']}, reused {counters['pool_reused']})")
+        if self.connect_latency.count:
+            print(f"Connect time:       p50 {self.connect_latency.percentile(50) / 1000:.1f} ms, "
+                  f"p99 {self.connect_latency.percentile(99) / 1000:.1f} ms")
+        if self.boot_latency.count:
+            print(f"Boot time:          p50 {self.boot_latency.percentile(50) / 1000:.1f} ms, "
+                  f"p99 {self.boot_latency.percentile(99) / 1000:.1f} ms")
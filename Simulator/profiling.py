@@ -0,0 +1,125 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Profiling a whole run, for finding where the simulator's own CPU goes at
+# scale. 'sample' looks at the running thread's stack every few
+# milliseconds and writes the stacks it saw in the collapsed format
+# flamegraph.pl and speedscope read ("outer;inner;leaf count" per line);
+# its cost does not grow with the call rate. 'cprofile' traces every
+# function call, which is exact but slows a busy run down several times,
+# and writes a .pstats file for pstats or snakeviz. The per-phase timings
+# in RunReport.phases are always on and need neither.
+
+MODES = ('sample', 'cprofile')
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    __slots__ = ('interval', 'thread_id', 'stacks', 'samples', 'labels', 'running', 'thread')
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.main_thread().ident
+        self.stacks = Counter()
+        self.samples = 0
+        # Code object -> label, so a sample costs a walk up the stack and a join.
+        self.labels = {}
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        labels = self.labels
+        while True:
+            time.sleep(self.interval)
+            if not self.running:
+                break
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = frame_label(code)
+                stack.append(label)
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[';'.join(stack)] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+    def top_functions(self, limit=15):
+        # The innermost frame of each sample: where the time is actually spent.
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return leaves.most_common(limit)
+
+
+@contextmanager
+def profiled(mode, output='profile', interval=0.005, limit=15):
+    # Wraps a run: `with profiled(settings.profile, ...): run()`. A false mode profiles nothing.
+    if not mode:
+        yield
+        return
+
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            path = f"{output}.pstats"
+            profiler.dump_stats(path)
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('tottime').print_stats(limit)
+            print(stream.getvalue().strip())
+            print(f"Profile written to {path}")
+        return
+
+    sampler = StackSampler(interval)
+    sampler.start()
+    try:
+        yield
+    finally:
+        sampler.stop()
+        path = f"{output}.collapsed"
+        sampler.write_collapsed(path)
+        print(f"Sampled stacks: {sampler.samples} every {interval * 1000:g} ms")
+        for label, count in sampler.top_functions(limit):
+            print(f"  {count / (sampler.samples or 1) * 100:5.1f}%  {label}")
+        print(f"Collapsed stacks written to {path}")
+
+
+def add_arguments(parser):
+    parser.add_argument('--profile', choices=MODES,
+                        help="profile the run: 'sample' writes collapsed stacks for a flamegraph, 'cprofile' a .pstats file")
+    parser.add_argument('--profile-output', default='profile',
+                        help="path of the profile without its extension (.collapsed or .pstats)")
+    parser.add_argument('--profile-interval', type=float, default=5, help="milliseconds between stack samples")
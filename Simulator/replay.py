@@ -0,0 +1,239 @@
+import asyncio
+import argparse
+import time
+
+import websockets
+
+import load
+import validator
+from calls import CallTracker, CALLERROR
+from clock import WALL_CLOCK, parse_speed, parse_timestamp
+from fleet import raise_open_file_limit
+from histogram import LatencyHistogram
+from report import RunReport
+from session import ChargePointSession
+from transactions import energy_reading
+from traces import DEFAULT_QUEUE_SIZE, StationFeeds, TraceReader
+
+# Replays a recorded trace (see traces.py) with each frame sent at its
+# original offset from the start of the trace, divided by --speed. Every
+# station waits for the answer to one frame before sending the next, like a
+# real one would. uniqueIds, transactionIds and timestamps are rewritten the
+# way All/test.py does for a single session.
+
+
+class ReplayStation:
+    __slots__ = ('session', 'tracker', 'transactions')
+
+    def __init__(self, session, tracker):
+        self.session = session
+        self.tracker = tracker
+        # Recorded transactionId -> the one the central system handed out now.
+        self.transactions = {}
+
+
+class Replay:
+    def __init__(self, settings):
+        self.settings = settings
+        self.speed, _ = parse_speed(settings.speed)
+        self.report = RunReport()
+        self.lag = LatencyHistogram()
+        self.trace_start = None
+        self.started = None
+        self.wall_start = None
+        self.tasks = set()
+        self.feeds = None
+
+    def due(self, recorded):
+        # Seconds from now until a frame recorded at `recorded` is due.
+        if self.speed is None:
+            return 0.0
+        return self.started + (recorded - self.trace_start) / self.speed - time.monotonic()
+
+    def live_time(self, recorded):
+        if self.speed is None:
+            return recorded - self.trace_start + self.wall_start
+        return self.wall_start + (recorded - self.trace_start) / self.speed
+
+    def rewrite_timestamp(self, value):
+        recorded = parse_timestamp(value)
+        return value if recorded is None else WALL_CLOCK.format(self.live_time(recorded))
+
+    def rewrite(self, station, action, payload):
+        # False when the frame cannot be sent as recorded.
+        if "timestamp" in payload:
+            payload["timestamp"] = self.rewrite_timestamp(payload["timestamp"])
+        for key in ("meterValue", "transactionData"):
+            for entry in payload.get(key) or ():
+                if isinstance(entry, dict) and "timestamp" in entry:
+                    entry["timestamp"] = self.rewrite_timestamp(entry["timestamp"])
+
+        if action == "StartTransaction":
+            station.session.select(payload.get("connectorId", 1))
+        elif "transactionId" in payload:
+            recorded = payload["transactionId"]
+            live = station.transactions.get(recorded)
+            if live is None:
+                connector = (station.session.get(payload["connectorId"]) if "connectorId" in payload
+                             else station.session.current())
+                live = connector.transaction_id
+                if live is None:
+                    # The central system never issued the recorded id; sending it would only be rejected.
+                    self.report.counters['unmapped_transaction_ids'] += 1
+                    self.report.counters[f"error: {action}: recorded transactionId {recorded!r} was never issued"] += 1
+                    return False
+                station.transactions[recorded] = live
+            payload["transactionId"] = live
+        return True
+
+    def check(self, station, action, payload, response):
+        counters = self.report.counters
+        if response[0] == CALLERROR:
+            counters['validation_failed'] += 1
+            counters[f"error: {action}: CALLERROR {response[2]}"] += 1
+            return
+        errors = validator.validate_response(action, response[2])
+        if errors:
+            counters['validation_failed'] += 1
+            counters['error: ' + errors[0]] += 1
+            return
+        # Recorded meter readings go through the run's TransactionIndex as well.
+        transactions = self.report.transactions
+        charge_point_id = station.session.charge_point_id
+        error = None
+        if action == "StartTransaction":
+            connector = station.session.current()
+            connector.transaction_id = response[2]["transactionId"]
+            error = transactions.start(connector.transaction_id, charge_point_id, connector.connector_id,
+                                       payload.get("idTag"), payload.get("meterStart"))
+        elif action == "MeterValues" and "transactionId" in payload:
+            error = transactions.meter(payload["transactionId"], charge_point_id, energy_reading(payload))
+        elif action == "StopTransaction":
+            connector = station.session.active_transaction(payload.get("transactionId"))
+            if connector is not None:
+                connector.transaction_id = None
+            error = transactions.stop(payload.get("transactionId"), charge_point_id, payload.get("meterStop"))
+        if error is not None:
+            counters['validation_failed'] += 1
+            counters[f"error: {action}: {error}"] += 1
+
+    def start_station(self, charge_point_id, queue):
+        task = asyncio.create_task(self.run_station(charge_point_id, queue))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run_station(self, charge_point_id, queue):
+        counters = self.report.counters
+        settings = self.settings
+        counters['stations_started'] += 1
+        trace_frame = await queue.get()
+        delay = self.due(trace_frame.time)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        try:
+            connect_started = time.perf_counter()
+            ws = await websockets.connect(
+                load.charge_point_url(settings.url, settings.id_prefix + charge_point_id),
+                subprotocols=[settings.subprotocol],
+                open_timeout=settings.response_timeout,
+                ping_interval=None,
+            )
+        except (OSError, asyncio.TimeoutError, websockets.exceptions.InvalidHandshake):
+            counters['connect_failed'] += 1
+            self.feeds.close(charge_point_id)
+            return
+        counters['connected'] += 1
+        counters['connect_seconds'] += time.perf_counter() - connect_started
+
+        tracker = CallTracker(ws, self.report, charge_point_id)
+        tracker.start()
+        station = ReplayStation(ChargePointSession(charge_point_id, ()), tracker)
+        try:
+            while trace_frame is not None:
+                delay = self.due(trace_frame.time)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if self.speed is not None:
+                    self.lag.record(max(0.0, -delay))
+
+                action, payload = trace_frame.frame[2], trace_frame.frame[3]
+                try:
+                    sendable = self.rewrite(station, action, payload)
+                except (AttributeError, TypeError, KeyError, ValueError) as error:
+                    counters[f"error: {action}: cannot rewrite the recorded payload ({type(error).__name__})"] += 1
+                    sendable = False
+                if sendable:
+                    response = await tracker.call(action, payload, settings.response_timeout)
+                    if response is not None:
+                        self.check(station, action, payload, response)
+                else:
+                    counters['requests_skipped'] += 1
+                trace_frame = await queue.get()
+            counters['sessions_completed'] += 1
+        except websockets.exceptions.ConnectionClosed:
+            counters['connection_lost'] += 1
+        finally:
+            if trace_frame is not None:
+                # Stopped early: drop the rest so a full queue cannot hold the reader back.
+                self.feeds.close(charge_point_id)
+            await tracker.stop()
+            await ws.close()
+
+    async def run(self):
+        reader = TraceReader(self.settings.trace)
+        frames = iter(reader)
+        first = next(frames, None)
+        if first is None:
+            return reader
+
+        def all_frames():
+            yield first
+            yield from frames
+
+        self.trace_start = first.time
+        self.started = time.monotonic()
+        self.wall_start = WALL_CLOCK.now()
+        self.feeds = StationFeeds(all_frames(), self.start_station, self.settings.queue_size)
+        await self.feeds.run()
+        while self.tasks:
+            await asyncio.wait(set(self.tasks))
+        self.report.elapsed_seconds = time.monotonic() - self.started
+        return reader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded OCPP traffic with its original per-station timing.")
+    parser.add_argument('trace', help="NDJSON trace file, optionally .gz")
+    parser.add_argument('--speed', default='1', help="replay speed-up factor (1, 10, 100, ...) or 'max'")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help="frames buffered per station")
+    parser.add_argument('--response-timeout', type=float, default=30)
+    parser.add_argument('--id-prefix', default='', help="prepended to every recorded charge point id")
+    parser.add_argument('--report-json', help="write counters and latency percentiles to this JSON file")
+    parser.add_argument('--report-csv', help="write per-action latency percentiles to this CSV file")
+    parser.add_argument('--url', default=load.url)
+    parser.add_argument('--subprotocol', default=load.socketProtocol)
+    settings = parser.parse_args()
+
+    raise_open_file_limit()
+    speed = "full speed" if settings.speed == 'max' else f"{settings.speed}x"
+    print(f"Replaying {settings.trace} at {speed} against {settings.url}")
+    replay = Replay(settings)
+    reader = asyncio.run(replay.run())
+    report = replay.report
+
+    skipped = reader.counters
+    print(f"Trace frames:       {skipped['frames']} (skipped {skipped['skipped frames']}, "
+          f"malformed {skipped['malformed lines']})")
+    if report.counters['requests_skipped']:
+        print(f"Frames not sent:    {report.counters['requests_skipped']} "
+              f"(unmapped transactionIds {report.counters['unmapped_transaction_ids']})")
+    if replay.lag.count:
+        print(f"Send lag:           p50 {replay.lag.percentile(50) / 1000:.1f} ms, "
+              f"p99 {replay.lag.percentile(99) / 1000:.1f} ms, max {replay.lag.max / 1000:.1f} ms")
+    load.print_results(report)
+    load.write_reports(report, settings)
+
+
+if __name__ == "__main__":
+    main()
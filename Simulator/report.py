@@ -0,0 +1,213 @@
+import csv
+import datetime
+import json
+import time
+from collections import Counter
+
+from histogram import LatencyHistogram, PERCENTILES
+from transactions import TransactionIndex
+
+# Where a CALL's time goes on our side, in the order it is spent.
+PHASES = ('encode', 'send', 'wait', 'decode', 'validate')
+
+CSV_FIELDS = ['action', 'count', 'throughput_per_s', 'mean_ms', 'min_ms'] + \
+    [f"p{percent:g}_ms".replace('.', '_') for percent in PERCENTILES] + ['max_ms']
+
+
+class ServerCallStats:
+    # CALLs one action from the central system: how many reached the
+    # stations, between which wall-clock times (how fast the server fanned
+    # them out), and how long the stations took to answer.
+    __slots__ = ('count', 'first', 'last', 'handling')
+
+    def __init__(self):
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.handling = LatencyHistogram()
+
+    def record(self, received_at, seconds):
+        self.count += 1
+        if self.first is None or received_at < self.first:
+            self.first = received_at
+        if self.last is None or received_at > self.last:
+            self.last = received_at
+        self.handling.record(seconds)
+
+    def merge(self, other):
+        self.count += other.count
+        if other.first is not None:
+            self.first = other.first if self.first is None else min(self.first, other.first)
+            self.last = other.last if self.last is None else max(self.last, other.last)
+        self.handling.merge(other.handling)
+
+    def spread(self):
+        return (self.last - self.first) if self.count else 0.0
+
+    def to_dict(self):
+        return {'count': self.count, 'first': self.first, 'last': self.last, 'handling': self.handling.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.count = data['count']
+        stats.first = data['first']
+        stats.last = data['last']
+        stats.handling = LatencyHistogram.from_dict(data['handling'])
+        return stats
+
+
+class RunReport:
+    def __init__(self):
+        self.counters = Counter()
+        # CALLs sent per action; what came back is in the latency histograms.
+        self.sent = Counter()
+        self.latency = {}
+        self.transactions = TransactionIndex()
+        self.server_calls = {}
+        # Phase -> [seconds, count]; see record_phase.
+        self.phases = {}
+        self.started_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self.elapsed_seconds = 0.0
+
+    def record_latency(self, action, seconds):
+        histogram = self.latency.get(action)
+        if histogram is None:
+            histogram = self.latency[action] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def record_phase(self, phase, seconds):
+        # Two additions per call, cheap enough to leave on in soak runs.
+        totals = self.phases.get(phase)
+        if totals is None:
+            totals = self.phases[phase] = [0.0, 0]
+        totals[0] += seconds
+        totals[1] += 1
+
+    def record_server_call(self, action, received_at, seconds):
+        stats = self.server_calls.get(action)
+        if stats is None:
+            stats = self.server_calls[action] = ServerCallStats()
+        stats.record(received_at, seconds)
+
+    def merge(self, other):
+        self.counters.update(other.counters)
+        self.sent.update(other.sent)
+        for action, histogram in other.latency.items():
+            self.latency.setdefault(action, LatencyHistogram()).merge(histogram)
+        self.transactions.merge(other.transactions)
+        for action, stats in other.server_calls.items():
+            self.server_calls.setdefault(action, ServerCallStats()).merge(stats)
+        for phase, (seconds, count) in other.phases.items():
+            totals = self.phases.setdefault(phase, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += count
+        # Merged reports come from runs side by side, so the slowest one sets the duration.
+        self.elapsed_seconds = max(self.elapsed_seconds, other.elapsed_seconds)
+        self.started_at = min(self.started_at, other.started_at)
+
+    def total_latency(self):
+        total = LatencyHistogram()
+        for histogram in self.latency.values():
+            total.merge(histogram)
+        return total
+
+    def summary_rows(self):
+        elapsed = self.elapsed_seconds or 1
+        rows = []
+        for action, histogram in sorted(self.latency.items()) + [('ALL', self.total_latency())]:
+            row = {
+                'action': action,
+                'count': histogram.count,
+                'throughput_per_s': round(histogram.count / elapsed, 2),
+                'mean_ms': round(histogram.mean() / 1000, 3),
+                'min_ms': round((histogram.min or 0) / 1000, 3),
+            }
+            for percent, field in zip(PERCENTILES, CSV_FIELDS[5:]):
+                row[field] = round(histogram.percentile(percent) / 1000, 3)
+            row['max_ms'] = round(histogram.max / 1000, 3)
+            rows.append(row)
+        return rows
+
+    def to_dict(self):
+        return {
+            'started_at': self.started_at,
+            'elapsed_seconds': round(self.elapsed_seconds, 3),
+            'counters': dict(sorted(self.counters.items())),
+            'sent': dict(sorted(self.sent.items())),
+            'summary': self.summary_rows(),
+            'latency': {action: histogram.to_dict() for action, histogram in sorted(self.latency.items())},
+            'transactions': self.transactions.to_dict(),
+            'server_calls': {action: stats.to_dict() for action, stats in sorted(self.server_calls.items())},
+            'phases': {phase: {'seconds': round(seconds, 6), 'count': count}
+                       for phase, (seconds, count) in self.phases.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        report = cls()
+        report.started_at = data['started_at']
+        report.elapsed_seconds = data['elapsed_seconds']
+        report.counters.update(data['counters'])
+        report.sent.update(data.get('sent', {}))
+        report.latency = {action: LatencyHistogram.from_dict(histogram) for action, histogram in data['latency'].items()}
+        if 'transactions' in data:
+            report.transactions = TransactionIndex.from_dict(data['transactions'])
+        report.server_calls = {action: ServerCallStats.from_dict(stats)
+                               for action, stats in data.get('server_calls', {}).items()}
+        report.phases = {phase: [totals['seconds'], totals['count']] for phase, totals in data.get('phases', {}).items()}
+        return report
+
+    def write_json(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def write_csv(self, path):
+        with open(path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.summary_rows())
+
+    def print_phases(self):
+        # wait is time spent waiting for the server; the rest is our own CPU.
+        total = sum(seconds for phase, (seconds, _) in self.phases.items() if phase != 'wait') or 1
+        print(f"{'Phase':<20}{'count':>9}{'total s':>10}{'mean us':>10}{'own CPU':>10}")
+        for phase in PHASES + tuple(sorted(set(self.phases) - set(PHASES))):
+            if phase not in self.phases:
+                continue
+            seconds, count = self.phases[phase]
+            share = "" if phase == 'wait' else f"{seconds / total * 100:.1f}%"
+            print(f"{phase:<20}{count:>9}{seconds:>10.3f}{seconds / (count or 1) * 1_000_000:>10.1f}{share:>10}")
+
+    def print_server_calls(self):
+        print(f"{'Server CALL':<24}{'count':>9}{'spread s':>10}{'per s':>10}{'answer p50':>12}{'p99':>10}  (ms)")
+        for action, stats in sorted(self.server_calls.items()):
+            spread = stats.spread()
+            rate = stats.count / spread if spread else 0.0
+            print(f"{action:<24}{stats.count:>9}{spread:>10.2f}{rate:>10.1f}"
+                  f"{stats.handling.percentile(50) / 1000:>12.2f}{stats.handling.percentile(99) / 1000:>10.2f}")
+
+    def print_latency(self):
+        print(f"{'Action':<20}{'count':>9}{'msg/s':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'p99.9':>10}{'max':>10}  (ms)")
+        for row in self.summary_rows():
+            print(f"{row['action']:<20}{row['count']:>9}{row['throughput_per_s']:>10.1f}"
+                  f"{row['p50_ms']:>10.2f}{row['p90_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+                  f"{row['p99_9_ms']:>10.2f}{row['max_ms']:>10.2f}")
+
+
+class PendingCalls:
+    # Send times of outstanding CALLs keyed by uniqueId (element [1] of the frame).
+    __slots__ = ('calls',)
+
+    def __init__(self):
+        self.calls = {}
+
+    def sent(self, unique_id, action):
+        self.calls[unique_id] = (action, time.perf_counter())
+
+    def answered(self, unique_id):
+        # Returns (action, seconds) or None when the uniqueId is unknown.
+        call = self.calls.pop(unique_id, None)
+        if call is None:
+            return None
+        return call[0], time.perf_counter() - call[1]
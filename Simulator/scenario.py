@@ -0,0 +1,238 @@
+import random
+import re
+
+import flow
+from flow import VARIABLE_FIELDS, Step
+
+# Scenarios described rather than recorded. Instead of a list of frames, a
+# scenario file may hold an object:
+#
+#   {"seed": 7, "connectors": 2,
+#    "variables": {"idTag": "TK_${station}", "vendor": {"choice": ["Imagine BV", "Alfen"]}},
+#    "steps": [
+#      {"BootNotification": {"chargePointVendor": "${vendor}", "chargePointModel": "FC42"}},
+#      {"repeat": 3, "variables": {"driver": {"randint": [1, 500]}, "tag": "TK_${driver}"}, "steps": [
+#        {"Authorize": {"idTag": "${tag}"}},
+#        {"think": {"exponential": 20}},
+#        ...]}]}
+#
+# It is compiled once into a Plan: flow.Steps with the loops unrolled (an
+# iteration repeats references to the same Steps, not copies) and two kinds
+# of step that send nothing, Bind and Think. Every station shares it, and
+# a "${name}" field is just one more field cut out of the Step's template,
+# so nothing is interpreted per message.
+#
+# The top-level variables are drawn once per station from a generator
+# seeded with the station id, so a station keeps its values across
+# sessions, reconnects and runs; "station" is the charge point id. A
+# repeat's variables are drawn again at the start of each iteration, for
+# each connector on its own when they run at once (--connectors). A
+# variable is a constant, a string that may use earlier variables
+# ("TK_${station}") or a distribution from DISTRIBUTIONS; a think time is a
+# number of seconds or a distribution. Fields the flow fills in itself
+# (connectorId, transactionId, timestamps, meterStart, meterStop) cannot
+# come from a variable: connectorId follows "connectors" (--connectors).
+
+REFERENCE = re.compile(r"\$\{(\w+)\}")
+FLOW_FIELDS = {"connectorId", "transactionId", "timestamp", "meterStart", "meterStop"}
+SCENARIO_KEYS = {"seed", "connectors", "variables", "steps"}
+# An unrolled plan longer than this is almost certainly a mistake; use --loop for soak runs.
+MAX_STEPS = 1_000_000
+
+# Name -> arguments -> draw(rng).
+DISTRIBUTIONS = {
+    "fixed": lambda value: lambda rng: value,
+    "choice": lambda values: lambda rng: rng.choice(values),
+    "randint": lambda bounds: lambda rng: rng.randint(*bounds),
+    "uniform": lambda bounds: lambda rng: rng.uniform(*bounds),
+    "exponential": lambda mean: lambda rng: rng.expovariate(1 / mean),
+    "normal": lambda parameters: lambda rng: rng.gauss(*parameters),
+}
+
+
+class ScenarioError(ValueError):
+    pass
+
+
+class Plan(list):
+    # The compiled steps, and the settings the scenario asks for.
+    __slots__ = ('connectors',)
+
+    def __init__(self, steps=(), connectors=0):
+        super().__init__(steps)
+        self.connectors = connectors
+
+
+class Bind:
+    # Draws a scope's variables into the session, or into the connector's
+    # own scope when it runs on one of several, so connectors charging at
+    # once each get their own. rng is None for the station's own variables,
+    # which get a generator seeded with the station id.
+    __slots__ = ('variables', 'rng', 'seed')
+    action = None
+
+    def __init__(self, variables, rng=None, seed=None):
+        self.variables = variables
+        self.rng = rng
+        self.seed = seed
+
+    def run(self, session, connector_id=None):
+        variables = dict(session.scope(connector_id))
+        rng = self.rng
+        if rng is None:
+            variables["station"] = session.charge_point_id
+            if self.variables:
+                rng = random.Random(f"{self.seed}/{session.charge_point_id}")
+        for name, draw in self.variables:
+            variables[name] = draw(rng, variables)
+        if connector_id is None:
+            session.variables = variables
+        else:
+            session.get(connector_id).variables = variables
+        return 0
+
+
+class Think:
+    __slots__ = ('draw', 'rng')
+    action = None
+
+    def __init__(self, draw, rng):
+        self.draw = draw
+        self.rng = rng
+
+    def run(self, session, connector_id=None):
+        # Seconds to pause on the station's clock.
+        return max(0.0, self.draw(self.rng))
+
+
+def compile_distribution(spec, where):
+    if isinstance(spec, (int, float)) and not isinstance(spec, bool):
+        return DISTRIBUTIONS["fixed"](spec)
+    if not isinstance(spec, dict) or len(spec) != 1 or next(iter(spec)) not in DISTRIBUTIONS:
+        raise ScenarioError(f"{where}: expected a number or one of {', '.join(DISTRIBUTIONS)}")
+    (kind, arguments), = spec.items()
+    draw = DISTRIBUTIONS[kind](arguments)
+    try:
+        draw(random.Random(0))
+    except (TypeError, ValueError, IndexError, ZeroDivisionError):
+        raise ScenarioError(f"{where}: invalid {kind} arguments {arguments!r}") from None
+    return draw
+
+
+def compile_variable(spec, scope, where):
+    # -> draw(rng, variables)
+    if isinstance(spec, dict):
+        draw = compile_distribution(spec, where)
+        return lambda rng, variables: draw(rng)
+    if not isinstance(spec, str):
+        return lambda rng, variables: spec
+    names = REFERENCE.findall(spec)
+    for name in names:
+        if name not in scope:
+            raise ScenarioError(f"{where}: unknown variable '{name}'")
+    whole = REFERENCE.fullmatch(spec)
+    if whole is not None:
+        name = whole[1]
+        return lambda rng, variables: variables[name]
+    if names:
+        return lambda rng, variables: REFERENCE.sub(lambda match: str(variables[match[1]]), spec)
+    return lambda rng, variables: spec
+
+
+def compile_variables(definitions, scope, sample, where):
+    # Returns (scope, sample, ((name, draw), ...)) with the definitions added.
+    # sample holds an example value of each variable, for checking messages.
+    if not isinstance(definitions, dict):
+        raise ScenarioError(f"{where}: expected an object of name: definition")
+    scope = set(scope)
+    sample = dict(sample)
+    variables = []
+    examples = random.Random(0)
+    for name, spec in definitions.items():
+        if not re.fullmatch(r"\w+", name) or name == "station":
+            raise ScenarioError(f"{where}: '{name}' cannot be a variable name")
+        draw = compile_variable(spec, scope, f"{where}.{name}")
+        scope.add(name)
+        sample[name] = draw(examples, sample)
+        variables.append((name, draw))
+    return scope, sample, tuple(variables)
+
+
+def fill(value, path, scope, sample, bindings, where):
+    # value with each "${name}" replaced by its example, collecting (path, name) in bindings.
+    if isinstance(value, dict):
+        return {key: fill(item, path + (key,), scope, sample, bindings, where) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fill(item, path + (index,), scope, sample, bindings, where) for index, item in enumerate(value)]
+    if not isinstance(value, str) or not REFERENCE.search(value):
+        return value
+    whole = REFERENCE.fullmatch(value)
+    if whole is None:
+        raise ScenarioError(f"{where}: '{value}' mixes text and variables; define it as a variable")
+    if whole[1] not in scope:
+        raise ScenarioError(f"{where}: unknown variable '{whole[1]}'")
+    bindings.append((path, whole[1]))
+    return sample[whole[1]]
+
+
+def compile_message(action, payload, scope, sample, where):
+    if not isinstance(payload, dict):
+        raise ScenarioError(f"{where}: the {action} payload must be an object")
+    bindings = []
+    example = fill(payload, (3,), scope, sample, bindings, where)
+    flow_paths = set(VARIABLE_FIELDS.get(action, {}).values())
+    for path, _ in bindings:
+        if (len(path) == 2 and path[1] in FLOW_FIELDS) or path in flow_paths:
+            raise ScenarioError(f"{where}: {action} {path[-1]} is filled in by the flow, not from a variable")
+    return Step([2, "", action, example], bindings)
+
+
+def compile_steps(specs, scope, sample, rng, where):
+    if not isinstance(specs, list):
+        raise ScenarioError(f"{where}: expected a list of steps")
+    steps = []
+    for number, spec in enumerate(specs):
+        here = f"{where}[{number}]"
+        if isinstance(spec, dict) and "repeat" in spec and set(spec) <= {"repeat", "variables", "steps"}:
+            count = spec["repeat"]
+            if not isinstance(count, int) or isinstance(count, bool) or count < 0:
+                raise ScenarioError(f"{here}: repeat must be a whole number")
+            inner_scope, inner_sample, variables = compile_variables(
+                spec.get("variables", {}), scope, sample, f"{here}.variables")
+            body = compile_steps(spec.get("steps"), inner_scope, inner_sample, rng, f"{here}.steps")
+            if variables:
+                body.insert(0, Bind(variables, rng))
+            if len(steps) + len(body) * count > MAX_STEPS:
+                raise ScenarioError(f"{here}: more than {MAX_STEPS} steps; use --loop for long runs")
+            steps.extend(body * count)
+        elif isinstance(spec, dict) and len(spec) == 1 and "think" in spec:
+            steps.append(Think(compile_distribution(spec["think"], f"{here}.think"), rng))
+        elif isinstance(spec, dict) and len(spec) == 1:
+            (action, payload), = spec.items()
+            steps.append(compile_message(action, payload, scope, sample, here))
+        else:
+            raise ScenarioError(f"{here}: expected {{action: payload}}, {{\"think\": seconds}} "
+                                f"or {{\"repeat\": n, \"steps\": [...]}}")
+    return steps
+
+
+def compile_scenario(scenario):
+    # A recorded scenario (a list of frames) or a described one, as a Plan.
+    if isinstance(scenario, list):
+        return Plan(flow.compile_scenario(scenario))
+    if not isinstance(scenario, dict) or "steps" not in scenario:
+        raise ScenarioError("expected a list of OCPP frames or an object with \"steps\"")
+    unknown = set(scenario) - SCENARIO_KEYS
+    if unknown:
+        raise ScenarioError(f"unknown key(s) {', '.join(sorted(unknown))}")
+    connectors = scenario.get("connectors", 0)
+    if not isinstance(connectors, int) or isinstance(connectors, bool) or connectors < 0:
+        raise ScenarioError("connectors must be a whole number")
+
+    seed = scenario.get("seed")
+    # Shared by every station, like Authorization's; only the station's own variables get a generator each.
+    rng = random.Random(seed) if seed is not None else random
+    scope, sample, variables = compile_variables(scenario.get("variables", {}), {"station"},
+                                                 {"station": "CP000000"}, "variables")
+    steps = compile_steps(scenario["steps"], scope, sample, rng, "steps")
+    return Plan([Bind(variables, seed=seed)] + steps, connectors)
@@ -0,0 +1,91 @@
+from clock import WALL_CLOCK
+from connector import transition_error
+
+# Per-station state for one run through a scenario. The compiled steps are
+# shared by every station; a session only holds what its own responses
+# taught it, so 100k stations cost 100k small objects rather than 100k
+# copies of the scenario.
+
+
+class ConnectorState:
+    # What one connector knows about its current transaction. timestamps are
+    # epoch seconds on the session's clock.
+    __slots__ = ('connector_id', 'status', 'id_tag', 'variables', 'transaction_id', 'started_at', 'timestamp',
+                 'meter_start', 'meter_stop')
+
+    def __init__(self, connector_id):
+        self.connector_id = connector_id
+        self.status = None
+        # The idTag the driver at this connector presented with Authorize;
+        # kept by reset(), which StartTransaction calls after it.
+        self.id_tag = None
+        # Scenario variables drawn for this connector when its steps run
+        # alongside the others' (--connectors); None uses the session's.
+        self.variables = None
+        self.transaction_id = None
+        self.started_at = None
+        self.timestamp = None
+        self.meter_start = None
+        self.meter_stop = None
+
+    def move(self, status):
+        # Records a StatusNotification the central system accepted. Returns an
+        # error string when OCPP does not allow the transition.
+        error = transition_error(self.connector_id, self.status, status)
+        self.status = status
+        return error
+
+    def reset(self):
+        self.transaction_id = None
+        self.started_at = None
+        self.timestamp = None
+        self.meter_start = None
+        self.meter_stop = None
+
+
+class ChargePointSession:
+    __slots__ = ('charge_point_id', 'clock', 'steps', 'index', 'connectors', 'connector', 'transactions',
+                 'authorization', 'variables')
+
+    def __init__(self, charge_point_id, steps, clock=WALL_CLOCK, transactions=None, authorization=None):
+        self.charge_point_id = charge_point_id
+        self.clock = clock
+        self.steps = steps
+        self.index = 0
+        self.connectors = {}
+        self.connector = None
+        # The run's TransactionIndex, shared by every session; None skips its checks.
+        self.transactions = transactions
+        # The station's idTag cache and local list, kept across its sessions; None sends every Authorize.
+        self.authorization = authorization
+        # Scenario variables by name; replaced, never changed, when a scenario draws new ones.
+        self.variables = {}
+
+    def get(self, connector_id):
+        connector = self.connectors.get(connector_id)
+        if connector is None:
+            connector = self.connectors[connector_id] = ConnectorState(connector_id)
+        return connector
+
+    def select(self, connector_id):
+        # Makes connector_id the connector that later requests without a
+        # connectorId (StopTransaction) refer to.
+        self.connector = self.get(connector_id)
+        return self.connector
+
+    def active_transaction(self, transaction_id):
+        for connector in self.connectors.values():
+            if connector.transaction_id == transaction_id:
+                return connector
+        return None
+
+    def scope(self, connector_id):
+        # The variables a step sees: its connector's, when it runs on one of several.
+        if connector_id is not None:
+            connector = self.connectors.get(connector_id)
+            if connector is not None and connector.variables is not None:
+                return connector.variables
+        return self.variables
+
+    def current(self):
+        return self.connector if self.connector is not None else self.select(1)
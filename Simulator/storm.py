@@ -0,0 +1,169 @@
+import asyncio
+import argparse
+import random
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import websockets
+
+import load
+import validator
+from calls import CallTracker, CALLERROR
+from clock import WALL_CLOCK
+from fleet import raise_open_file_limit
+from histogram import LatencyHistogram
+from report import RunReport
+
+# Worst case after a site power cut: every station reconnects within a short
+# window, boots, reports each connector and starts heartbeating.
+
+
+def arrival_offsets(count, window, pattern, seed=None):
+    rng = random.Random(seed)
+    if pattern == 'burst' or count <= 1:
+        return [0.0] * count
+    if pattern == 'uniform':
+        return [number * window / count for number in range(count)]
+    # Poisson arrivals: exponential gaps averaging window / count.
+    offsets = []
+    arrival = 0.0
+    for _ in range(count):
+        offsets.append(arrival)
+        arrival += rng.expovariate(count / window)
+    return offsets
+
+
+def boot_notification(charge_point_id):
+    return {"chargePointVendor": "Imagine BV", "chargePointModel": "FC42",
+            "chargePointSerialNumber": charge_point_id[-25:], "firmwareVersion": "v1.0"}
+
+
+def handshake_failure(error):
+    if isinstance(error, websockets.exceptions.InvalidStatus):
+        return f"HTTP {error.response.status_code}"
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    return type(error).__name__
+
+
+async def boot_station(charge_point_id, offset, started, settings, report, storm):
+    counters = report.counters
+    delay = started + offset - time.monotonic()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+    connect_started = time.perf_counter()
+    try:
+        ws = await websockets.connect(
+            load.charge_point_url(settings.url, charge_point_id),
+            subprotocols=[settings.subprotocol],
+            open_timeout=settings.response_timeout,
+            ping_interval=None,
+        )
+    except (OSError, asyncio.TimeoutError, websockets.exceptions.InvalidHandshake) as error:
+        storm.failures[handshake_failure(error)] += 1
+        return None
+    storm.connect.record(time.perf_counter() - connect_started)
+    counters['connected'] += 1
+
+    tracker = CallTracker(ws, report, charge_point_id)
+    tracker.start()
+    try:
+        for attempt in range(settings.max_boot_attempts):
+            response = await tracker.call("BootNotification", boot_notification(charge_point_id), settings.response_timeout)
+            if response is None or response[0] == CALLERROR or validator.validate_response("BootNotification", response[2]):
+                counters['boot_failed'] += 1
+                return ws
+            payload = response[2]
+            if payload["status"] == "Accepted":
+                if payload["interval"] != 900:
+                    counters['boot_wrong_interval'] += 1
+                    return ws
+                break
+            # Pending or Rejected: the station has to wait `interval` seconds before booting again.
+            counters['boot_' + payload["status"].lower()] += 1
+            await asyncio.sleep(payload["interval"] or settings.retry_interval)
+        else:
+            counters['boot_gave_up'] += 1
+            return ws
+
+        storm.accepted.record(time.monotonic() - started)
+        counters['accepted'] += 1
+
+        for connector_id in range(settings.connectors + 1):
+            await tracker.call("StatusNotification", {
+                "connectorId": connector_id, "errorCode": "NoError", "status": "Available",
+                "timestamp": WALL_CLOCK.timestamp()}, settings.response_timeout)
+        await tracker.call("Heartbeat", {}, settings.response_timeout)
+        counters['completed'] += 1
+    except websockets.exceptions.ConnectionClosed:
+        counters['connection_lost'] += 1
+    finally:
+        await tracker.stop()
+    return ws
+
+
+async def run_storm(station_ids, settings):
+    report = RunReport()
+    storm = SimpleNamespace(connect=LatencyHistogram(), accepted=LatencyHistogram(), failures=Counter())
+    offsets = arrival_offsets(len(station_ids), settings.window, settings.arrivals, settings.seed)
+
+    started = time.monotonic()
+    connections = await asyncio.gather(*(
+        boot_station(charge_point_id, offset, started, settings, report, storm)
+        for charge_point_id, offset in zip(station_ids, offsets)))
+    report.elapsed_seconds = time.monotonic() - started
+
+    # Drop every connection at once, like the next power cut would.
+    await asyncio.gather(*(ws.close() for ws in connections if ws is not None), return_exceptions=True)
+    return report, storm
+
+
+def print_storm(report, storm, stations):
+    counters = report.counters
+    print(f"Connected:            {counters['connected']}/{stations}")
+    print(f"Handshake failures:   {sum(storm.failures.values())}")
+    for reason, count in storm.failures.most_common():
+        print(f"  {count:8d}  {reason}")
+    print(f"Connect time:         p50 {storm.connect.percentile(50) / 1000:.1f} ms, "
+          f"p99 {storm.connect.percentile(99) / 1000:.1f} ms, max {storm.connect.max / 1000:.1f} ms")
+    print(f"Accepted (900 s):     {counters['accepted']}/{stations} "
+          f"(pending {counters['boot_pending']}, rejected {counters['boot_rejected']}, "
+          f"wrong interval {counters['boot_wrong_interval']}, failed {counters['boot_failed']})")
+    if counters['accepted'] == stations:
+        print(f"All stations Accepted after {storm.accepted.max / 1_000_000:.2f} s")
+    elif storm.accepted.count:
+        print(f"Last Accepted after {storm.accepted.max / 1_000_000:.2f} s, {stations - counters['accepted']} never were")
+    print(f"Completed boot flow:  {counters['completed']}/{stations}")
+    print()
+    report.print_latency()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconnect N stations at once and measure how the central system copes.")
+    parser.add_argument('--stations', type=int, default=1000)
+    parser.add_argument('--window', type=float, default=10, help="seconds over which the stations reconnect")
+    parser.add_argument('--arrivals', choices=['uniform', 'burst', 'poisson'], default='poisson')
+    parser.add_argument('--connectors', type=int, default=2, help="StatusNotifications per station, besides connector 0")
+    parser.add_argument('--rounds', type=int, default=1, help="repeat the storm, dropping all connections in between")
+    parser.add_argument('--max-boot-attempts', type=int, default=5)
+    parser.add_argument('--retry-interval', type=float, default=30, help="wait before rebooting when a Pending/Rejected interval is 0")
+    parser.add_argument('--response-timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--id-prefix', default='CP')
+    parser.add_argument('--url', default=load.url)
+    parser.add_argument('--subprotocol', default=load.socketProtocol)
+    settings = parser.parse_args()
+
+    raise_open_file_limit()
+    station_ids = load.charge_point_ids(settings.stations, settings.id_prefix)
+    for storm_round in range(1, settings.rounds + 1):
+        print(f"Round {storm_round}: {settings.stations} stations, {settings.arrivals} arrivals over {settings.window} s")
+        report, storm = asyncio.run(run_storm(station_ids, settings))
+        print_storm(report, storm, settings.stations)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import asyncio
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import websockets
+
+import codec
+import flow
+import load
+import validator
+from calls import CALLERROR
+from pool import ConnectionPool
+from report import RunReport
+from session import ChargePointSession
+
+# Runs every per-action test case (Authorize/authorize_valid.json,
+# BootNotification/boot_notification_missing_fields.json, ...) in one go.
+# A case named *_valid must be accepted; any other case (invalid,
+# missing_fields, empty, ...) passes when the request is rejected, either by
+# our own schema check or by the central system.
+
+ROOT = Path(__file__).resolve().parent.parent
+SKIPPED_DIRECTORIES = {"All", "Simulator"}
+
+
+class Case:
+    __slots__ = ('script', 'path', 'name', 'message', 'error', 'expect_valid')
+
+    def __init__(self, script, path):
+        self.script = script
+        self.path = path
+        self.name = f"{path.parent.name}/{path.name}"
+        self.expect_valid = path.stem.endswith('_valid')
+        self.message = None
+        self.error = None
+        try:
+            self.message = codec.loads(path.read_bytes())
+        except codec.DecodeError as e:
+            self.error = f"not valid JSON: {e}"
+            return
+        if not isinstance(self.message, list) or len(self.message) != 4 or not isinstance(self.message[3], dict):
+            self.error = "not a CALL frame [2, uniqueId, action, payload]"
+            self.message = None
+
+
+def discover_cases(root=ROOT, patterns=()):
+    # Every JSON payload next to a test script, e.g. (Authorize/Authorize.py, Authorize/authorize_valid.json).
+    cases = []
+    for directory in sorted(path for path in root.iterdir() if path.is_dir()):
+        if directory.name in SKIPPED_DIRECTORIES or directory.name.startswith('.'):
+            continue
+        scripts = sorted(directory.glob('*.py'))
+        if not scripts:
+            continue
+        for path in sorted(directory.glob('*.json')):
+            case = Case(scripts[0], path)
+            if not patterns or any(pattern in case.name for pattern in patterns):
+                cases.append(case)
+    return cases
+
+
+class CaseResult:
+    __slots__ = ('case', 'passed', 'detail', 'latency')
+
+    def __init__(self, case, passed, detail, latency=None):
+        self.case = case
+        self.passed = passed
+        self.detail = detail
+        self.latency = latency
+
+
+async def run_case(tracker, case, settings):
+    if case.message is None:
+        if case.expect_valid:
+            return CaseResult(case, False, case.error)
+        return CaseResult(case, True, f"rejected locally: {case.error}")
+
+    action, payload = case.message[2], case.message[3]
+    errors = validator.validate_request(action, payload)
+    if errors:
+        if case.expect_valid:
+            return CaseResult(case, False, errors[0])
+        if not settings.send_invalid:
+            return CaseResult(case, True, f"rejected locally: {errors[0]}")
+
+    started = time.perf_counter()
+    response = await tracker.call(action, payload, settings.response_timeout)
+    latency = time.perf_counter() - started
+    if response is None:
+        return CaseResult(case, False, "no response", latency)
+
+    if errors:
+        # An invalid request sent anyway: the central system has to refuse it.
+        if response[0] == CALLERROR:
+            return CaseResult(case, True, f"server answered CALLERROR {response[2]}", latency)
+        return CaseResult(case, False, f"server accepted it: {errors[0]}", latency)
+
+    session = ChargePointSession(tracker.prefix, ())
+    # Each case runs on its own, as if its idTag had been authorized before.
+    session.get(payload.get("connectorId", 1)).id_tag = payload.get("idTag")
+    request = [2, response[1], action, payload]
+    error = flow.validate_response_fields(session, request, response)
+    if case.expect_valid:
+        return CaseResult(case, error is None, error or "accepted", latency)
+    if error is not None:
+        return CaseResult(case, True, f"server rejected it: {error}", latency)
+    return CaseResult(case, False, "server accepted it", latency)
+
+
+async def run_worker(charge_point_id, queue, results, pool, settings):
+    # Takes cases off the queue, borrowing the connection for its identity
+    # from the pool for each one.
+    while not queue.empty():
+        case = queue.get_nowait()
+        try:
+            async with pool.connection(charge_point_id, settings.subprotocol) as tracker:
+                results.append(await run_case(tracker, case, settings))
+        except OSError as e:
+            results.append(CaseResult(case, False, f"cannot connect: {e}"))
+        except websockets.exceptions.ConnectionClosed:
+            results.append(CaseResult(case, False, "connection closed"))
+
+
+async def run_suite(cases, settings):
+    report = RunReport()
+    pool = ConnectionPool(settings.url, report, settings.response_timeout, boot=settings.boot)
+    queue = asyncio.Queue()
+    for case in cases:
+        queue.put_nowait(case)
+    charge_point_ids = load.charge_point_ids(min(settings.connections, len(cases)), settings.id_prefix)
+    results = []
+    try:
+        # Connects (and boots) are timed by the pool, before the cases run.
+        await pool.warm(charge_point_ids, settings.subprotocol)
+        started = time.monotonic()
+        await asyncio.gather(*(run_worker(charge_point_id, queue, results, pool, settings)
+                               for charge_point_id in charge_point_ids))
+        report.elapsed_seconds = time.monotonic() - started
+    finally:
+        await pool.close()
+    return results, report, pool
+
+
+def print_suite(results, report, pool):
+    width = max((len(result.case.name) for result in results), default=0)
+    for result in sorted(results, key=lambda result: result.case.name):
+        latency = f"{result.latency * 1000:7.1f} ms" if result.latency is not None else " " * 10
+        print(f"{'PASS' if result.passed else 'FAIL'}  {result.case.name:<{width}}  {latency}  {result.detail}")
+    passed = sum(result.passed for result in results)
+    print(f"\n{passed} passed, {len(results) - passed} failed in {report.elapsed_seconds:.2f} s\n")
+    pool.print_connects()
+    print()
+    if report.latency:
+        report.print_latency()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run every per-action test case against the central system at once.")
+    parser.add_argument('patterns', nargs='*', help="only run cases whose path contains one of these")
+    parser.add_argument('--connections', type=int, default=4, help="connections the cases are spread over")
+    parser.add_argument('--send-invalid', action='store_true',
+                        help="send requests that fail our schema check too, and expect a CALLERROR")
+    parser.add_argument('--boot', action='store_true', help="send a BootNotification on every connection before the cases")
+    parser.add_argument('--response-timeout', type=float, default=10)
+    parser.add_argument('--id-prefix', default='SUITE')
+    parser.add_argument('--url', default=load.url)
+    parser.add_argument('--subprotocol', default=load.socketProtocol)
+    settings = parser.parse_args()
+
+    cases = discover_cases(patterns=settings.patterns)
+    if not cases:
+        print("No test cases found.")
+        sys.exit(1)
+    print(f"Running {len(cases)} cases over {min(settings.connections, len(cases))} connections against {settings.url}\n")
+    results, report, pool = asyncio.run(run_suite(cases, settings))
+    print_suite(results, report, pool)
+    sys.exit(0 if all(result.passed for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
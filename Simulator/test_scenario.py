@@ -0,0 +1,83 @@
+import itertools
+
+import flow
+import scenario
+from connector import split_scenario
+from session import ChargePointSession
+
+# Two connectors run a repeat with a driver drawn per iteration. Their steps
+# are interleaved the way run_session's coroutines interleave them, so one
+# connector's draw would replace the other's if they shared a scope.
+
+SCENARIO = {
+    "seed": 1,
+    "steps": [
+        {"BootNotification": {"chargePointVendor": "Imagine BV", "chargePointModel": "FC42"}},
+        {"repeat": 2, "variables": {"driver": {"randint": [1, 100000]}, "tag": "TK_${driver}"}, "steps": [
+            {"Authorize": {"idTag": "${tag}"}},
+            {"StartTransaction": {"connectorId": 1, "idTag": "${tag}", "meterStart": 0,
+                                  "timestamp": "2024-07-29T08:26:58Z"}},
+            {"StopTransaction": {"meterStop": 10, "timestamp": "2024-07-29T08:26:58Z", "transactionId": 0}},
+        ]},
+    ],
+}
+
+transaction_ids = itertools.count(1)
+
+RESPONSES = {
+    "BootNotification": lambda request: {"status": "Accepted", "currentTime": "2024-07-29T08:26:58Z", "interval": 900},
+    "Authorize": lambda request: {"idTagInfo": {"status": "Accepted"}},
+    "StartTransaction": lambda request: {"idTagInfo": {"status": "Accepted"},
+                                         "transactionId": next(transaction_ids)},
+    "StopTransaction": lambda request: {},
+}
+
+
+def send(session, step, connector_id, sent):
+    if step.action is None:
+        step.run(session, connector_id)
+        return None
+    values, error = flow.request_values(session, step, connector_id)
+    assert error is None
+    values["uniqueId"] = f"{connector_id}-{len(sent)}"
+    request = step.request(values)
+    sent.append((connector_id, request))
+    return flow.validate_response_fields(session, request, [3, request[1], RESPONSES[step.action](request)])
+
+
+def test_connectors_keep_their_own_drivers():
+    plan = scenario.compile_scenario(SCENARIO)
+    station_steps, connector_steps = split_scenario(plan)
+    # The repeat's Bind runs on each connector, not once for the station.
+    assert connector_steps[0].action is None
+
+    session = ChargePointSession("CP000001", plan)
+    sent = []
+    for step in station_steps:
+        assert send(session, step, None, sent) is None
+    for step in connector_steps:
+        for connector_id in (1, 2):
+            assert send(session, step, connector_id, sent) is None
+
+    authorized = {}
+    started = []
+    for connector_id, request in sent:
+        if request[2] == "Authorize":
+            authorized[connector_id] = request[3]["idTag"]
+        elif request[2] == "StartTransaction":
+            assert request[3]["connectorId"] == connector_id
+            assert request[3]["idTag"] == authorized[connector_id]
+            started.append(request[3]["idTag"])
+    assert len(started) == 4
+    assert len(set(started)) == 4
+
+
+def test_start_with_another_connectors_tag_fails():
+    plan = scenario.compile_scenario(SCENARIO)
+    session = ChargePointSession("CP000001", plan)
+    session.get(1).id_tag = "TK_1"
+    session.get(2).id_tag = "TK_2"
+    request = [2, "1", "StartTransaction", {"connectorId": 1, "idTag": "TK_2", "meterStart": 0,
+                                            "timestamp": "2024-07-29T08:26:58Z"}]
+    response = [3, "1", RESPONSES["StartTransaction"](request)]
+    assert flow.validate_response_fields(session, request, response) is not None
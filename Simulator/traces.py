@@ -0,0 +1,172 @@
+import argparse
+import asyncio
+import gzip
+import mmap
+import sys
+import time
+from collections import Counter
+
+import codec
+from calls import CALL
+from clock import parse_timestamp
+
+# Recorded traffic, one JSON object per line (NDJSON), in receive order:
+#
+#   {"time": "2024-07-29T08:26:58.539Z", "chargePointId": "CP000001",
+#    "frame": [2, "17223202", "BootNotification", {...}]}
+#
+# "time" may also be epoch seconds. Lines with "from": "cs" are frames the
+# central system sent and are not replayed. Files ending in .gz are read
+# through gzip, anything else is memory-mapped; either way lines are parsed
+# one at a time, so memory does not grow with the size of the trace.
+
+DEFAULT_QUEUE_SIZE = 64
+
+
+class TraceFrame:
+    __slots__ = ('time', 'charge_point_id', 'frame')
+
+    def __init__(self, time, charge_point_id, frame):
+        self.time = time
+        self.charge_point_id = charge_point_id
+        self.frame = frame
+
+
+def read_lines(path):
+    if str(path).endswith('.gz'):
+        with gzip.open(path, 'rb') as file:
+            yield from file
+        return
+    with open(path, 'rb') as file:
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped.
+            return
+        with mapped:
+            yield from iter(mapped.readline, b'')
+
+
+class TraceReader:
+    # Iterates the charge point CALLs of a trace. Lines that are not a usable
+    # record are counted in `counters` and skipped.
+    def __init__(self, path):
+        self.path = path
+        self.counters = Counter()
+
+    def __iter__(self):
+        counters = self.counters
+        for line in read_lines(self.path):
+            line = line.strip()
+            if not line or line.startswith(b'#'):
+                continue
+            try:
+                record = codec.loads(line)
+                frame = record["frame"]
+                charge_point_id = record["chargePointId"]
+                received = record["time"]
+            except (codec.DecodeError, KeyError, TypeError):
+                counters['malformed lines'] += 1
+                continue
+            if record.get("from", "cp") != "cp" or not isinstance(frame, list) or len(frame) != 4 or frame[0] != CALL:
+                counters['skipped frames'] += 1
+                continue
+            if not isinstance(frame[2], str) or not isinstance(frame[3], dict):
+                # A CALL no station could send: replaying it would only fail on the way out.
+                counters['malformed lines'] += 1
+                continue
+            if not isinstance(received, (int, float)):
+                received = parse_timestamp(received)
+                if received is None:
+                    counters['malformed lines'] += 1
+                    continue
+            counters['frames'] += 1
+            yield TraceFrame(received, charge_point_id, frame)
+
+
+class StationFeeds:
+    # Routes frames from one reader into a bounded queue per station, calling
+    # start_station(charge_point_id, queue) the first time a station appears.
+    # A full queue holds the reader back, so at most queue_size frames per
+    # station are ever in memory. Because the trace is in time order, a
+    # station blocking the reader only holds back frames that are due later
+    # than its own queued ones. None in a queue marks the end of the trace.
+    def __init__(self, frames, start_station, queue_size=DEFAULT_QUEUE_SIZE):
+        self.frames = frames
+        self.start_station = start_station
+        self.queue_size = queue_size
+        self.queues = {}
+        self.closed = set()
+
+    def close(self, charge_point_id):
+        # Called by a station that stopped consuming; its frames are dropped.
+        self.closed.add(charge_point_id)
+        queue = self.queues.get(charge_point_id)
+        while queue is not None and not queue.empty():
+            queue.get_nowait()
+
+    async def run(self):
+        for number, trace_frame in enumerate(self.frames):
+            charge_point_id = trace_frame.charge_point_id
+            if charge_point_id in self.closed:
+                continue
+            queue = self.queues.get(charge_point_id)
+            if queue is None:
+                queue = self.queues[charge_point_id] = asyncio.Queue(self.queue_size)
+                self.start_station(charge_point_id, queue)
+            if queue.full():
+                await queue.put(trace_frame)
+            else:
+                queue.put_nowait(trace_frame)
+                if number % 1000 == 0:
+                    # Let the stations run while the reader is ahead of them.
+                    await asyncio.sleep(0)
+        for charge_point_id, queue in self.queues.items():
+            if charge_point_id not in self.closed:
+                await queue.put(None)
+
+
+def max_rss_mib():
+    # Peak memory of this process, or None where there is no resource module (Windows).
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB on Linux and the BSDs.
+    return max_rss / 2 ** 20 if sys.platform == 'darwin' else max_rss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read an NDJSON trace and summarize it.")
+    parser.add_argument('trace', help="NDJSON trace file, optionally .gz")
+    args = parser.parse_args()
+
+    reader = TraceReader(args.trace)
+    stations = set()
+    actions = Counter()
+    first = last = None
+    started = time.perf_counter()
+    for trace_frame in reader:
+        stations.add(trace_frame.charge_point_id)
+        actions[trace_frame.frame[2]] += 1
+        if first is None:
+            first = trace_frame.time
+        last = trace_frame.time
+    elapsed = time.perf_counter() - started
+
+    counters = reader.counters
+    print(f"Frames:    {counters['frames']} ({counters['frames'] / (elapsed or 1):.0f}/s to read)")
+    print(f"Stations:  {len(stations)}")
+    print(f"Skipped:   {counters['skipped frames']} frames, {counters['malformed lines']} malformed lines")
+    if first is not None:
+        print(f"Span:      {last - first:.1f} s ({first:.3f} .. {last:.3f})")
+    max_rss = max_rss_mib()
+    if max_rss is not None:
+        print(f"Max RSS:   {max_rss:.0f} MiB")
+    for action, count in actions.most_common():
+        print(f"  {count:10d}  {action}")
+
+
+if __name__ == "__main__":
+    main()
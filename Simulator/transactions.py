@@ -0,0 +1,157 @@
+# Every transaction the central system handed out during a run, keyed by
+# transactionId, so one dict lookup per StartTransaction, MeterValues and
+# StopTransaction checks them across all connections: the same id issued
+# twice, meter readings that go backwards, and transactions still open when
+# the run ends. A fleet worker's index is merged into the others like the
+# rest of its RunReport.
+
+from collections import deque
+
+ENERGY_MEASURAND = "Energy.Active.Import.Register"
+# Stopped transactionIds remembered to catch reuse; a soak run would otherwise keep every id it ever saw.
+ISSUED_LIMIT = 1_000_000
+
+
+def energy_reading(payload):
+    # The last Energy.Active.Import.Register sample of a MeterValues request,
+    # in Wh, or None when it has none. The measurand is the default when missing.
+    reading = None
+    for meter_value in payload.get("meterValue") or ():
+        for sample in meter_value.get("sampledValue") or ():
+            if sample.get("measurand", ENERGY_MEASURAND) != ENERGY_MEASURAND:
+                continue
+            try:
+                value = float(sample["value"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            reading = value * 1000 if sample.get("unit") == "kWh" else value
+    return reading
+
+
+class TransactionRecord:
+    __slots__ = ('transaction_id', 'charge_point_id', 'connector_id', 'id_tag', 'meter_start', 'last_meter')
+
+    def __init__(self, transaction_id, charge_point_id, connector_id, id_tag, meter_start):
+        self.transaction_id = transaction_id
+        self.charge_point_id = charge_point_id
+        self.connector_id = connector_id
+        self.id_tag = id_tag
+        self.meter_start = meter_start
+        self.last_meter = meter_start
+
+
+def format_meter(value):
+    return "?" if value is None else f"{value:g}"
+
+
+class TransactionIndex:
+    # Open transactions by id. Stopped ones leave the index, so a soak run
+    # holds what is open plus the last issued_limit ids in `issued`, which
+    # catch reuse. An id reused after that many others goes unnoticed.
+    def __init__(self, issued_limit=ISSUED_LIMIT):
+        self.open = {}
+        self.issued = set()
+        # issued in the order the ids were handed out, to forget the oldest.
+        self.issued_order = deque()
+        self.issued_limit = issued_limit
+        self.started = 0
+        self.stopped = 0
+        self.duplicates = 0
+        self.meter_regressions = 0
+
+    def start(self, transaction_id, charge_point_id, connector_id, id_tag, meter_start):
+        self.started += 1
+        record = TransactionRecord(transaction_id, charge_point_id, connector_id, id_tag, meter_start)
+        previous = self.open.get(transaction_id)
+        self.open[transaction_id] = record
+        if transaction_id in self.issued:
+            self.duplicates += 1
+            if previous is not None and previous.charge_point_id != charge_point_id:
+                return "transactionId is still open on another charge point"
+            return "transactionId was issued before"
+        self.remember(transaction_id)
+        return None
+
+    def remember(self, transaction_id):
+        self.issued.add(transaction_id)
+        self.issued_order.append(transaction_id)
+        if len(self.issued_order) > self.issued_limit:
+            self.issued.discard(self.issued_order.popleft())
+
+    def owned(self, transaction_id, charge_point_id):
+        # Returns (record, error) for a request about transaction_id from charge_point_id.
+        record = self.open.get(transaction_id)
+        if record is None:
+            return None, "transactionId is not open"
+        if record.charge_point_id != charge_point_id:
+            return None, "transactionId belongs to another charge point"
+        return record, None
+
+    def meter(self, transaction_id, charge_point_id, reading):
+        record, error = self.owned(transaction_id, charge_point_id)
+        if error is not None or reading is None:
+            return error
+        if record.last_meter is not None and reading < record.last_meter:
+            self.meter_regressions += 1
+            return "meter value is below the previous reading"
+        record.last_meter = reading
+        return None
+
+    def stop(self, transaction_id, charge_point_id, meter_stop):
+        record, error = self.owned(transaction_id, charge_point_id)
+        if error is not None:
+            return error
+        del self.open[transaction_id]
+        self.stopped += 1
+        if meter_stop is not None and record.last_meter is not None and meter_stop < record.last_meter:
+            self.meter_regressions += 1
+            return "meterStop is below the last meter reading"
+        return None
+
+    def orphans(self):
+        # Transactions started and never stopped, e.g. on a lost connection.
+        return list(self.open.values())
+
+    def merge(self, other):
+        # Ids issued in both workers were handed out twice by the server.
+        self.duplicates += other.duplicates + len(self.issued & other.issued)
+        for transaction_id in other.issued_order:
+            if transaction_id not in self.issued:
+                self.remember(transaction_id)
+        self.open.update(other.open)
+        self.started += other.started
+        self.stopped += other.stopped
+        self.meter_regressions += other.meter_regressions
+
+    def to_dict(self):
+        return {
+            'started': self.started,
+            'stopped': self.stopped,
+            'duplicates': self.duplicates,
+            'meter_regressions': self.meter_regressions,
+            'orphans': [[record.transaction_id, record.charge_point_id, record.connector_id, record.id_tag,
+                         record.meter_start, record.last_meter] for record in self.orphans()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        index.started = data['started']
+        index.stopped = data['stopped']
+        index.duplicates = data['duplicates']
+        index.meter_regressions = data['meter_regressions']
+        for transaction_id, charge_point_id, connector_id, id_tag, meter_start, last_meter in data['orphans']:
+            record = TransactionRecord(transaction_id, charge_point_id, connector_id, id_tag, meter_start)
+            record.last_meter = last_meter
+            index.open[transaction_id] = record
+        return index
+
+    def print_summary(self, limit=10):
+        orphans = self.orphans()
+        print(f"Transactions:       {self.started} started, {self.stopped} stopped, {len(orphans)} open at the end "
+              f"(duplicate ids {self.duplicates}, meter regressions {self.meter_regressions})")
+        for record in orphans[:limit]:
+            print(f"  open  {record.transaction_id}  {record.charge_point_id} connector {record.connector_id}  "
+                  f"idTag {record.id_tag}  meter {format_meter(record.meter_start)} -> {format_meter(record.last_meter)} Wh")
+        if len(orphans) > limit:
+            print(f"  ... and {len(orphans) - limit} more")
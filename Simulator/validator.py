@@ -0,0 +1,132 @@
+import json
+import re
+from pathlib import Path
+
+# The OCPP 1.6 JSON schemas are compiled once, at import time, into plain
+# checker functions: enums become frozensets, required fields tuples, and the
+# per-action checker is looked up in a dict instead of an if/elif ladder.
+
+SCHEMA_DIR = Path(__file__).resolve().parent / 'schemas'
+
+DATE_TIME = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:\d{2})$')
+
+TYPE_CHECKS = {
+    'string': lambda value: isinstance(value, str),
+    'integer': lambda value: isinstance(value, int) and not isinstance(value, bool),
+    'number': lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    'boolean': lambda value: isinstance(value, bool),
+    'object': lambda value: isinstance(value, dict),
+    'array': lambda value: isinstance(value, list),
+}
+
+
+def compile_schema(schema, path, strict):
+    checks = []
+    schema_type = schema.get('type')
+
+    if schema_type is not None:
+        is_type = TYPE_CHECKS[schema_type]
+
+        def check_type(value, errors):
+            if not is_type(value):
+                errors.append(f"{path}: expected {schema_type}, got {type(value).__name__}")
+                return False
+            return True
+    else:
+        def check_type(value, errors):
+            return True
+
+    if 'enum' in schema:
+        allowed = frozenset(schema['enum'])
+
+        def check_enum(value, errors):
+            if value not in allowed:
+                errors.append(f"{path}: '{value}' is not one of the allowed values")
+        checks.append(check_enum)
+
+    if 'maxLength' in schema:
+        max_length = schema['maxLength']
+
+        def check_max_length(value, errors):
+            if len(value) > max_length:
+                errors.append(f"{path}: longer than {max_length} characters")
+        checks.append(check_max_length)
+
+    if schema.get('format') == 'date-time':
+        def check_date_time(value, errors):
+            if not DATE_TIME.match(value):
+                errors.append(f"{path}: '{value}' is not an ISO 8601 date-time")
+        checks.append(check_date_time)
+
+    if schema_type == 'object':
+        properties = {name: compile_schema(subschema, f"{path}.{name}", strict)
+                      for name, subschema in schema.get('properties', {}).items()}
+        required = tuple(schema.get('required', ()))
+        closed = strict and schema.get('additionalProperties') is False
+
+        def check_object(value, errors):
+            for name in required:
+                if name not in value:
+                    errors.append(f"{path}: missing required field '{name}'")
+            for name, item in value.items():
+                check = properties.get(name)
+                if check is not None:
+                    check(item, errors)
+                elif closed:
+                    errors.append(f"{path}: unexpected field '{name}'")
+        checks.append(check_object)
+
+    if schema_type == 'array' and 'items' in schema:
+        check_item = compile_schema(schema['items'], f"{path}[]", strict)
+
+        def check_array(value, errors):
+            for item in value:
+                check_item(item, errors)
+        checks.append(check_array)
+
+    checks = tuple(checks)
+
+    def check(value, errors):
+        if check_type(value, errors):
+            for check_part in checks:
+                check_part(value, errors)
+
+    return check
+
+
+def load_checkers():
+    request_checkers = {}
+    response_checkers = {}
+    for schema_file in sorted(SCHEMA_DIR.glob('*.json')):
+        with open(schema_file, 'r') as file:
+            schema = json.load(file)
+        name = schema_file.stem
+        # Requests we send are held to the schema exactly. Servers in the wild
+        # add vendor fields to their answers (ours returns "Status" on
+        # MeterValues), so unknown fields in responses are not an error.
+        if name.endswith('Response'):
+            response_checkers[name[:-len('Response')]] = compile_schema(schema, name, strict=False)
+        else:
+            request_checkers[name] = compile_schema(schema, name, strict=True)
+    return request_checkers, response_checkers
+
+
+REQUEST_CHECKERS, RESPONSE_CHECKERS = load_checkers()
+
+
+def validate_request(action, payload):
+    check = REQUEST_CHECKERS.get(action)
+    if check is None:
+        return [f"unknown action '{action}'"]
+    errors = []
+    check(payload, errors)
+    return errors
+
+
+def validate_response(action, payload):
+    check = RESPONSE_CHECKERS.get(action)
+    if check is None:
+        return [f"unknown action '{action}'"]
+    errors = []
+    check(payload, errors)
+    return errors
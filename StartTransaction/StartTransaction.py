@@ -1,6 +1,12 @@
 import websocket
 import json
 import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path('..', 'Simulator')))
+import validator
+from commands import answer_message
 
 url = "ws://localhost:5028/OCPP1" 
 socketProtocol = 'ocpp1.6'
@@ -10,13 +16,12 @@ def load_request_message(file_path):
         return json.load(file)
 
 def validate_request_fields(request_message):
-    required_fields = ["connectorId", "idTag", "meterStart", "timestamp"]
-    payload = request_message[3]
-    for field in required_fields:
-        if field not in payload:
-            print(f"Validation failed: Missing required field '{field}'")
-            return False
-    print("Validation successful: All required fields are present.")
+    errors = validator.validate_request(request_message[2], request_message[3])
+    if errors:
+        for error in errors:
+            print(f"Validation failed: {error}")
+        return False
+    print("Validation successful: Request matches the StartTransaction schema.")
     return True
 
 def validate_response_fields(response_message, ws):
@@ -37,16 +42,10 @@ def validate_response_fields(response_message, ws):
             return False
 
         payload = response[2]
-        if not isinstance(payload, dict):
-            print("Validation failed: Payload is not a valid JSON object.")
-            return False
-
-        if "idTagInfo" not in payload:
-            print("Validation failed: Missing 'idTagInfo'.")
-            return False
-
-        if "transactionId" not in payload:
-            print("Validation failed: Missing 'transactionId'.")
+        errors = validator.validate_response("StartTransaction", payload)
+        if errors:
+            for error in errors:
+                print(f"Validation failed: {error}")
             return False
 
         id_tag_info = payload["idTagInfo"]
@@ -61,7 +60,12 @@ def validate_response_fields(response_message, ws):
         return False
 
 def on_message(ws, message):
-    print(f"Received response: {message}")
+    reply = answer_message(message)
+    if reply is not None:
+        print(f"Answered server CALL {message} with {reply}")
+        ws.send(reply)
+        return
+    print(f"Received response after {(time.perf_counter() - ws.sent_at) * 1000:.1f} ms: {message}")
     if validate_response_fields(message, ws):
         ws.close()
 
@@ -88,6 +92,7 @@ def on_open(ws):
         ws.close()
         return
     
+    ws.sent_at = time.perf_counter()
     ws.send(json.dumps(start_transaction_req))
     print("Sent StartTransaction request")
 